@@ -0,0 +1,87 @@
+"""Benchmark de extremo a extremo contra el servidor Notion falso (sin red).
+
+Arranca src/fake_notion_server.py en segundo plano con un fixture o una página sintética,
+procesa la página con main.process_page y muestra el tiempo total, el rendimiento y el
+número de llamadas a la API por endpoint.
+
+Uso:
+    python benchmarks/bench_end_to_end.py --fixture fixtures/lecture_notes.json
+    python benchmarks/bench_end_to_end.py --generate-blocks 3000 --latency-ms 100 --rate-limit-probability 0.02
+    python benchmarks/bench_end_to_end.py --generate-blocks 3000 --dry-run --json
+    python benchmarks/bench_end_to_end.py --generate-pages 40 --generate-blocks 300 --latency-ms 100 --workers 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "src"))
+
+from fake_notion_server import (add_workspace_arguments, build_workspace_from_arguments,  # noqa: E402
+                                start_fake_notion_server)
+from main import process_pages  # noqa: E402
+from notion_scheduler import NotionRequestScheduler  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_workspace_arguments(parser)
+    parser.add_argument("--dry-run", action="store_true", help="sólo planifica, sin escrituras")
+    parser.add_argument("--client-requests-per-second", type=float, default=3.0,
+                        help="ritmo del planificador del cliente")
+    parser.add_argument("--client-burst-size", type=int, default=10)
+    parser.add_argument("--max-concurrent-requests", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=4, help="páginas procesadas a la vez")
+    parser.add_argument("--json", action="store_true", help="imprime los resultados como JSON")
+    args = parser.parse_args()
+    if not args.fixture and not args.generate_blocks:
+        parser.error("indica --fixture o --generate-blocks")
+
+    workspace = build_workspace_from_arguments(args)
+    page_ids = [block_id for block_id, block in workspace.blocks.items() if block["type"] == "child_page"]
+    block_count = len(workspace.blocks) - len(page_ids)
+    server, base_url = start_fake_notion_server(workspace)
+    scheduler = NotionRequestScheduler(requests_per_second=args.client_requests_per_second,
+                                       burst_size=args.client_burst_size,
+                                       max_concurrent_requests=args.max_concurrent_requests)
+
+    # El journal forma parte del coste real de una ejecución, pero no debe quedar en el repo.
+    journal_dir = tempfile.TemporaryDirectory()
+
+    async def run_all():
+        await process_pages("fake-token", page_ids, workers=args.workers, scheduler=scheduler, dry_run=args.dry_run,
+                            notion_base_url=base_url, journal_dir=journal_dir.name)
+
+    started = time.perf_counter()
+    asyncio.run(run_all())
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+    journal_dir.cleanup()
+
+    api_calls = dict(workspace.stats)
+    results = {
+        "pages": len(page_ids),
+        "blocks": block_count,
+        "workers": args.workers,
+        "dry_run": args.dry_run,
+        "seconds": round(elapsed, 3),
+        "blocks_per_second": round(block_count / elapsed, 1),
+        "api_calls_total": sum(count for endpoint, count in api_calls.items() if endpoint != "rate_limited"),
+        "api_calls": api_calls,
+        "client_metrics": {key: value for key, value in scheduler.metrics.to_dict().items()
+                           if key in ("throttle_wait_seconds", "concurrency_wait_seconds", "backoff_seconds",
+                                      "parse_seconds", "retries")},
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for key, value in results.items():
+            print(f"{key:<20} {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Benchmark del conversor offline (src/offline_converter.py) con distinto número de procesos.
+
+Genera un archivo sintético de exportaciones en formato `children.list` (páginas del
+servidor Notion local, con los hijos anidados en `children`), lo convierte con 1, 2, 4...
+procesos y muestra el rendimiento en MB/s y la aceleración respecto a un solo proceso.
+
+Uso:
+    python benchmarks/bench_offline_converter.py
+    python benchmarks/bench_offline_converter.py --files 32 --blocks-per-file 5000 --workers 1 2 4 8 --json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "src"))
+
+from fake_notion_server import FakeNotionWorkspace, generate_page_blocks  # noqa: E402
+from offline_converter import convert_files  # noqa: E402
+
+
+def export_tree(workspace: FakeNotionWorkspace, block_id: str):
+    blocks = []
+    for child_id in workspace.children.get(block_id, []):
+        block = dict(workspace.blocks[child_id])
+        if workspace.children.get(child_id):
+            block["children"] = export_tree(workspace, child_id)
+        blocks.append(block)
+    return blocks
+
+
+def write_archive(directory: str, files: int, blocks_per_file: int):
+    workspace = FakeNotionWorkspace()
+    for file_index in range(files):
+        page_id = f"page-{file_index}"
+        workspace.add_page(page_id, generate_page_blocks(blocks_per_file, seed=file_index))
+        export = {"object": "list", "results": export_tree(workspace, page_id), "next_cursor": None,
+                  "has_more": False, "type": "block", "block": {}}
+        with open(os.path.join(directory, f"{page_id}.json"), "w", encoding="utf-8") as export_file:
+            json.dump(export, export_file, ensure_ascii=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=16)
+    parser.add_argument("--blocks-per-file", type=int, default=3000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("--json", action="store_true", help="imprime los resultados como JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as archive_dir:
+        write_archive(archive_dir, args.files, args.blocks_per_file)
+        total_bytes = sum(os.path.getsize(os.path.join(archive_dir, name)) for name in os.listdir(archive_dir))
+        results = []
+        for workers in sorted(set(args.workers)):
+            with tempfile.TemporaryDirectory() as output_dir:
+                started = time.perf_counter()
+                convert_files([archive_dir], output_dir, workers=workers)
+                elapsed = time.perf_counter() - started
+            results.append({"workers": workers, "seconds": round(elapsed, 3),
+                            "mb_per_second": round(total_bytes / elapsed / 1e6, 2)})
+        for result in results:
+            result["speedup"] = round(results[0]["seconds"] / result["seconds"], 2)
+
+    if args.json:
+        print(json.dumps({"files": args.files, "bytes": total_bytes, "cpu_count": os.cpu_count(), "runs": results}, indent=2))
+    else:
+        print(f"{args.files} ficheros, {total_bytes / 1e6:.1f} MB, {os.cpu_count()} núcleos")
+        for result in results:
+            print(f"workers={result['workers']:<3} {result['seconds']:>8.2f} s {result['mb_per_second']:>8.2f} MB/s "
+                  f"x{result['speedup']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Micro-benchmark del tokenizador de KaTeX (`segment_katex_text`).
+
+Mide el rendimiento en MB/s sobre corpus sintéticos y reales (`benchmarks/corpus/*.txt`)
+y lo compara con la implementación anterior basada en cadenas de `re.split`.
+
+Uso:
+    python benchmarks/bench_tokenizer.py
+    python benchmarks/bench_tokenizer.py --min-mbps 20   # falla si algún corpus queda por debajo
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import timeit
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "src"))
+
+from main import segment_katex_text  # noqa: E402
+
+
+def legacy_parse_text_for_inline_katex(text: str):
+    # Implementación previa al tokenizador, conservada como referencia.
+    parts = re.split(r'(\$(?!\$)[^$]*?\$(?<!\$\$))', text)
+    if len(parts) == 1: return None
+    segments = []
+    has_katex_segment = False
+    for part_content in parts:
+        if not part_content: continue
+        is_inline_katex = part_content.startswith("$") and part_content.endswith("$") and \
+                          not part_content.startswith("$$") and not part_content.endswith("$$") and \
+                          len(part_content) > 2
+        if is_inline_katex:
+            expression = part_content[1:-1].strip()
+            if expression:
+                segments.append(('katex', expression))
+                has_katex_segment = True
+        else:
+            if part_content or (segments and segments[-1][0] == 'katex'):
+                segments.append(('text', part_content))
+    return segments if has_katex_segment and not all(s[0] == 'text' for s in segments) else None
+
+
+def legacy_segment_katex_text(text: str):
+    segments = []
+    for part in re.split(r"(\$\$[\s\S]+?\$\$)", text):
+        if not part.strip(): continue
+        if part.startswith("$$") and part.endswith("$$") and part.count("$$") == 2 and part[2:-2].strip():
+            segments.append(('block_katex', part[2:-2].strip()))
+        else:
+            segments.extend(legacy_parse_text_for_inline_katex(part) or [('text', part)])
+    return segments
+
+
+def build_synthetic_corpora(seed: int = 1234):
+    rng = random.Random(seed)
+    words = ["sea", "la", "función", "continua", "entonces", "existe", "tal", "que", "para", "todo",
+             "derivable", "intervalo", "serie", "converge", "límite", "teorema", "valor", "medio"]
+    expressions = [r"x^2 + y^2", r"\frac{a}{b}", r"\int_0^1 f(x)\,dx", r"\sum_{k=1}^{n} k",
+                   r"\alpha \cdot \beta", r"e^{i\pi} + 1 = 0", r"\sqrt{2}"]
+
+    def prose(n_words):
+        return " ".join(rng.choice(words) for _ in range(n_words))
+
+    # Bloques sin '$', uno por llamada como en Notion: mide el atajo `'$' not in text` más la
+    # propia llamada. En un único texto enorme sólo se mediría una comprobación de `in`.
+    plain = [prose(40) for _ in range(2000)]
+    inline_heavy = "\n".join(f"{prose(6)} ${rng.choice(expressions)}$ {prose(4)} ${rng.choice(expressions)}$"
+                             for _ in range(2000))
+    display_heavy = "\n".join(f"{prose(8)}\n$${rng.choice(expressions)}$$\n{prose(3)} ${rng.choice(expressions)}$"
+                              for _ in range(2000))
+    escaped_dollars = "\n".join(f"cuesta \\${rng.randint(1, 99)} y ${rng.choice(expressions)}$ {prose(5)}"
+                                for _ in range(2000))
+    # Caso patológico para las regex perezosas: muchos $$ sin cerrar.
+    unclosed = "$$ " + " ".join(f"{prose(3)} $" for _ in range(3000))
+    return {
+        "synthetic/plain": plain,
+        "synthetic/inline_heavy": inline_heavy,
+        "synthetic/display_heavy": display_heavy,
+        "synthetic/escaped_dollars": escaped_dollars,
+        "synthetic/unclosed_delimiters": unclosed,
+    }
+
+
+def load_real_corpora():
+    corpora = {}
+    corpus_dir = os.path.join(BENCHMARKS_DIR, "corpus")
+    for file_name in sorted(os.listdir(corpus_dir)):
+        if file_name.endswith(".txt"):
+            with open(os.path.join(corpus_dir, file_name), encoding="utf-8") as corpus_file:
+                # Cada línea es el plain_text de un bloque de Notion.
+                corpora[f"real/{file_name}"] = corpus_file.read().splitlines()
+    return corpora
+
+
+def measure_mbps(tokenize, blocks, repeat: int):
+    size_mb = sum(len(block.encode("utf-8")) for block in blocks) / 1_000_000
+    best = min(timeit.repeat(lambda: [tokenize(block) for block in blocks], number=1, repeat=repeat))
+    return size_mb / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="repeticiones por corpus (se toma la mejor)")
+    parser.add_argument("--min-mbps", type=float, default=None,
+                        help="umbral mínimo de MB/s del tokenizador; sale con código 1 si no se alcanza")
+    parser.add_argument("--json", action="store_true", help="imprime los resultados como JSON")
+    args = parser.parse_args()
+
+    corpora = {name: text if isinstance(text, list) else [text] for name, text in build_synthetic_corpora().items()}
+    # Los corpus reales se repiten para que la medición no quede dominada por el ruido.
+    corpora.update({name: blocks * 200 for name, blocks in load_real_corpora().items()})
+
+    results = []
+    for name, blocks in corpora.items():
+        results.append({
+            "corpus": name,
+            "size_mb": round(sum(len(block.encode("utf-8")) for block in blocks) / 1_000_000, 3),
+            "tokenizer_mbps": round(measure_mbps(segment_katex_text, blocks, args.repeat), 2),
+            "legacy_mbps": round(measure_mbps(legacy_segment_katex_text, blocks, args.repeat), 2),
+        })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'corpus':<36} {'MB':>8} {'tokenizador MB/s':>18} {'anterior MB/s':>15}")
+        for result in results:
+            print(f"{result['corpus']:<36} {result['size_mb']:>8} {result['tokenizer_mbps']:>18} {result['legacy_mbps']:>15}")
+
+    if args.min_mbps is not None:
+        slow = [result for result in results if result["tokenizer_mbps"] < args.min_mbps]
+        for result in slow:
+            print(f"REGRESIÓN: {result['corpus']} a {result['tokenizer_mbps']} MB/s (< {args.min_mbps})", file=sys.stderr)
+        if slow: sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
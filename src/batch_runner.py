@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import re
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+logger = logging.getLogger("notion_katex.batch")
+
+PAGE_ID_PATTERN = re.compile(r"([0-9a-fA-F]{8})-?([0-9a-fA-F]{4})-?([0-9a-fA-F]{4})-?([0-9a-fA-F]{4})-?([0-9a-fA-F]{12})$")
+
+
+def normalize_page_id(page_id: str) -> str:
+    """Devuelve el ID con guiones y en minúsculas; acepta también el final de una URL de Notion."""
+    match = PAGE_ID_PATTERN.search(page_id.strip())
+    return "-".join(match.groups()).lower() if match else page_id.strip()
+
+
+def read_page_ids_file(path: str):
+    """Lee un ID (o URL) de página por línea, ignorando líneas vacías y comentarios con '#'."""
+    with open(path, encoding="utf-8") as page_ids_file:
+        return [line.split("#", 1)[0].strip() for line in page_ids_file if line.split("#", 1)[0].strip()]
+
+
+async def _iter_paginated(endpoint, scheduler, **kwargs):
+    start_cursor = None
+    while True:
+        response = await scheduler.call(endpoint, start_cursor=start_cursor, page_size=100, **kwargs)
+        for result in response["results"]:
+            yield result
+        if not response.get("has_more"): break
+        start_cursor = response["next_cursor"]
+
+
+async def iter_database_page_ids(notion_client, scheduler, database_id: str):
+    """IDs de todas las páginas (filas) de una base de datos, paginando databases.query."""
+    async for page in _iter_paginated(notion_client.databases.query, scheduler, database_id=database_id):
+        if not page.get("archived"): yield page["id"]
+
+
+async def iter_search_page_ids(notion_client, scheduler, query: str):
+    """IDs de las páginas compartidas con la integración cuyo título coincide con `query`."""
+    async for page in _iter_paginated(notion_client.search, scheduler, query=query,
+                                      filter={"property": "object", "value": "page"}):
+        if not page.get("archived"): yield page["id"]
+
+
+async def collect_page_ids(notion_client, scheduler, page_ids=(), database_ids=(), search_queries=()):
+    """Reúne las páginas de todas las fuentes, sin duplicados y en orden de aparición."""
+    collected = {}
+    for page_id in page_ids:
+        collected.setdefault(normalize_page_id(page_id), None)
+    for database_id in database_ids:
+        async for page_id in iter_database_page_ids(notion_client, scheduler, normalize_page_id(database_id)):
+            collected.setdefault(normalize_page_id(page_id), None)
+    for query in search_queries:
+        async for page_id in iter_search_page_ids(notion_client, scheduler, query):
+            collected.setdefault(normalize_page_id(page_id), None)
+    return list(collected)
+
+
+@dataclass
+class PageResult:
+    page_id: str
+    blocks_scanned: int = 0
+    error_count: int = 0
+    seconds: float = 0.0
+    # Excepción que abortó la página entera (None si llegó al final, aunque fuese con errores).
+    failure: Optional[str] = None
+    context: object = None
+
+    @property
+    def succeeded(self):
+        return self.failure is None and self.error_count == 0
+
+
+class BatchProgress:
+    """Informe por página y resumen final de rendimiento de una ejecución por lotes."""
+
+    def __init__(self, total_pages: int):
+        self.total_pages = total_pages
+        self.results = []
+        self.started_at = time.perf_counter()
+
+    def report(self, result: PageResult):
+        self.results.append(result)
+        blocks_per_second = result.blocks_scanned / result.seconds if result.seconds else 0.0
+        status = f"FALLO: {result.failure}" if result.failure else f"{result.error_count} errores"
+        logger.info("PROGRESO [%d/%d] %s: %d bloques en %.1f s (%.1f bloques/s), %s",
+                    len(self.results), self.total_pages, result.page_id, result.blocks_scanned, result.seconds,
+                    blocks_per_second, status, extra={"page_id": result.page_id})
+
+    @property
+    def failed_pages(self):
+        return [result for result in self.results if not result.succeeded]
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started_at
+        total_blocks = sum(result.blocks_scanned for result in self.results)
+        blocks_per_second = total_blocks / elapsed if elapsed else 0.0
+        return (f"RESUMEN: {len(self.results)} páginas ({len(self.failed_pages)} con errores), "
+                f"{total_blocks} bloques en {elapsed:.1f} s ({blocks_per_second:.1f} bloques/s)")
+
+
+async def run_worker_pool(page_ids: list, process_one, workers: int, progress: BatchProgress):
+    """Reparte las páginas entre `workers` tareas que comparten el planificador de la API.
+
+    `process_one(page_id)` procesa una página y devuelve su RunContext; un fallo en una
+    página se anota en su resultado y no detiene al resto.
+    """
+    pending = asyncio.Queue()
+    for page_id in page_ids:
+        pending.put_nowait(page_id)
+
+    async def worker():
+        while not pending.empty():
+            page_id = pending.get_nowait()
+            result = PageResult(page_id)
+            started = time.perf_counter()
+            try:
+                result.context = await process_one(page_id)
+                result.blocks_scanned = result.context.blocks_scanned
+                result.error_count = result.context.error_count
+            except Exception as e:
+                result.failure = str(e) or type(e).__name__
+            result.seconds = time.perf_counter() - started
+            progress.report(result)
+
+    await asyncio.gather(*(worker() for _ in range(max(1, min(workers, len(page_ids))))))
+    return progress.results
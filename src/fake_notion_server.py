@@ -0,0 +1,542 @@
+"""Servidor local que imita la API de bloques de Notion, para pruebas y benchmarks sin red.
+
+Implementa los endpoints que usa main.py:
+    GET    /v1/blocks/{id}            (blocks.retrieve)
+    GET    /v1/blocks/{id}/children   (blocks.children.list, con paginación)
+    PATCH  /v1/blocks/{id}/children   (blocks.children.append, con `after`)
+    PATCH  /v1/blocks/{id}            (blocks.update)
+    DELETE /v1/blocks/{id}            (blocks.delete)
+    POST   /v1/databases/{id}/query   (databases.query, con paginación)
+    POST   /v1/search                 (search por título, con paginación)
+    GET    /__stats                   (número de llamadas por endpoint)
+
+Puede añadir latencia artificial y responder HTTP 429 (con Retry-After) de forma aleatoria o
+al superar un ritmo de peticiones, como hace Notion, e inyectar fallos en endpoints concretos
+(`FakeNotionWorkspace.inject_failure`, p. ej. para probar la reanudación). Los datos se cargan de un fixture JSON
+(`--fixture`), se generan sintéticamente (`--generate-blocks`) o se graban de una página
+real con el subcomando `record`. Como Notion, rellena el `plain_text` de lo que se escribe,
+también el de las menciones ("@nombre", el título de la página...).
+
+Uso:
+    python src/fake_notion_server.py serve --fixture fixtures/lecture_notes.json --latency-ms 150
+    python src/fake_notion_server.py serve --generate-pages 50 --generate-blocks 400
+    python src/fake_notion_server.py record PAGE_ID fixtures/mi_pagina.json
+    NOTION_BASE_URL=http://127.0.0.1:8765 python src/main.py --dry-run
+"""
+import argparse
+import copy
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+MAX_PAGE_SIZE = 100
+BLOCK_PATH_PATTERN = re.compile(r"^/v1/blocks/(?P<block_id>[^/]+)(?P<children>/children)?$")
+DATABASE_QUERY_PATH_PATTERN = re.compile(r"^/v1/databases/(?P<database_id>[^/]+)/query$")
+
+
+class FakeNotionError(Exception):
+    def __init__(self, status: int, code: str, message: str):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+        self.message = message
+
+
+def notion_now():
+    # Notion devuelve last_edited_time redondeado al minuto.
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:00.000Z")
+
+
+DEFAULT_ANNOTATIONS = {"bold": False, "italic": False, "strikethrough": False, "underline": False,
+                       "code": False, "color": "default"}
+
+
+class FakeNotionWorkspace:
+    """Árbol de bloques en memoria más la configuración de latencia y errores inyectados."""
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, rate_limit_probability: float = 0,
+                 requests_per_second: float = 0, retry_after_seconds: int = 1, seed: int = None):
+        self.blocks = {}
+        self.children = {}
+        self.databases = {}
+        # plain_text de cada mención ((tipo, ID) -> "@Ana"), aprendido de los bloques cargados:
+        # las menciones que llegan por update/append no traen plain_text y Notion lo genera.
+        self.mention_plain_texts = {}
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit_probability = rate_limit_probability
+        self.requests_per_second = requests_per_second
+        self.retry_after_seconds = retry_after_seconds
+        self.stats = Counter()
+        self.injected_failures = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_count = 0
+
+    # --- Rich text ---
+
+    def _mention_plain_text(self, rich_text_item: dict):
+        mention = rich_text_item.get("mention") or {}
+        mention_type = mention.get("type")
+        target = mention.get(mention_type) or {}
+        key = (mention_type, target.get("id"))
+        if "plain_text" in rich_text_item:
+            # Menciones leídas de Notion (fixtures o páginas grabadas): se recuerda su texto.
+            if target.get("id"): self.mention_plain_texts[key] = rich_text_item["plain_text"]
+            return rich_text_item["plain_text"]
+        if key in self.mention_plain_texts: return self.mention_plain_texts[key]
+        # Lo que mostraría Notion: "@nombre", el título de la página o base de datos, la fecha...
+        if mention_type == "user": return "@" + (target.get("name") or "Anonymous")
+        if mention_type == "page":
+            page = self.blocks.get(target.get("id"), {})
+            return page.get("child_page", {}).get("title") or "Untitled"
+        if mention_type == "database":
+            return self.databases.get(target.get("id"), {}).get("title") or "Untitled"
+        if mention_type == "date":
+            return target.get("start", "") + (f" → {target['end']}" if target.get("end") else "")
+        if mention_type == "link_preview": return target.get("url", "")
+        return ""
+
+    def _rich_text_plain_text(self, rich_text_item: dict):
+        item_type = rich_text_item.get("type")
+        if item_type == "text": return rich_text_item.get("text", {}).get("content", "")
+        if item_type == "equation": return rich_text_item.get("equation", {}).get("expression", "")
+        if item_type == "mention": return self._mention_plain_text(rich_text_item)
+        return rich_text_item.get("plain_text", "")
+
+    def _fill_rich_text(self, rich_text_list: list):
+        for rich_text_item in rich_text_list:
+            rich_text_item["plain_text"] = self._rich_text_plain_text(rich_text_item)
+            rich_text_item.setdefault("annotations", dict(DEFAULT_ANNOTATIONS))
+            if rich_text_item.get("type") == "text":
+                rich_text_item["href"] = (rich_text_item["text"].get("link") or {}).get("url")
+        return rich_text_list
+
+    def _fill_block_rich_text(self, block: dict):
+        type_data = block.get(block.get("type"), {})
+        if isinstance(type_data.get("rich_text"), list):
+            self._fill_rich_text(type_data["rich_text"])
+        for cell in type_data.get("cells", []) if block.get("type") == "table_row" else []:
+            self._fill_rich_text(cell)
+
+    # --- Carga de datos ---
+
+    def add_page(self, page_id: str, blocks: list, title: str = "", database_id: str = None):
+        parent = {"type": "database_id", "database_id": database_id} if database_id else {"type": "workspace", "workspace": True}
+        self.blocks[page_id] = {
+            "object": "block", "id": page_id, "type": "child_page", "child_page": {"title": title},
+            "has_children": bool(blocks), "archived": False, "last_edited_time": notion_now(), "parent": parent}
+        if database_id: self.add_database(database_id)["page_ids"].append(page_id)
+        self._add_children(page_id, blocks)
+
+    def add_database(self, database_id: str, title: str = ""):
+        return self.databases.setdefault(database_id, {"title": title, "page_ids": []})
+
+    def _add_children(self, parent_id: str, blocks: list):
+        child_ids = self.children.setdefault(parent_id, [])
+        created = []
+        for block_data in blocks:
+            block = copy.deepcopy(block_data)
+            nested_children = block.pop("children", None) or block.get(block.get("type"), {}).pop("children", None)
+            block["object"] = "block"
+            block.setdefault("id", str(uuid.uuid4()))
+            block["has_children"] = bool(nested_children)
+            block["archived"] = False
+            block["parent"] = {"type": "block_id", "block_id": parent_id}
+            block.setdefault("last_edited_time", notion_now())
+            self._fill_block_rich_text(block)
+            self.blocks[block["id"]] = block
+            child_ids.append(block["id"])
+            created.append(block)
+            if nested_children:
+                self._add_children(block["id"], nested_children)
+        if created and parent_id in self.blocks:
+            self.blocks[parent_id]["has_children"] = True
+        return created
+
+    def load_fixture(self, fixture: dict):
+        for page in fixture.get("pages", []):
+            self.add_page(page["id"], page["blocks"], page.get("title", ""))
+        for database in fixture.get("databases", []):
+            self.add_database(database["id"], database.get("title", ""))
+            for page in database["pages"]:
+                self.add_page(page["id"], page["blocks"], page.get("title", ""), database_id=database["id"])
+
+    # --- Operaciones de la API ---
+
+    def _get_block(self, block_id: str):
+        block = self.blocks.get(block_id)
+        if block is None or block.get("archived"):
+            raise FakeNotionError(404, "object_not_found", f"Could not find block with ID: {block_id}.")
+        return block
+
+    def _touch(self, block: dict):
+        block["last_edited_time"] = notion_now()
+        # Como en Notion, una edición actualiza también la página que contiene el bloque.
+        parent_id = block.get("parent", {}).get("block_id")
+        while parent_id in self.blocks:
+            parent = self.blocks[parent_id]
+            if parent.get("type") == "child_page":
+                parent["last_edited_time"] = block["last_edited_time"]
+                break
+            parent_id = parent.get("parent", {}).get("block_id")
+
+    def retrieve_block(self, block_id: str):
+        return copy.deepcopy(self._get_block(block_id))
+
+    def list_children(self, block_id: str, start_cursor: str = None, page_size: int = MAX_PAGE_SIZE):
+        self._get_block(block_id)
+        child_ids = self.children.get(block_id, [])
+        page_size = max(1, min(MAX_PAGE_SIZE, page_size))
+        start = 0
+        if start_cursor:
+            if start_cursor not in child_ids:
+                raise FakeNotionError(400, "validation_error", f"start_cursor {start_cursor} is not valid.")
+            start = child_ids.index(start_cursor)
+        page_ids = child_ids[start:start + page_size]
+        next_cursor = child_ids[start + page_size] if start + page_size < len(child_ids) else None
+        return {"object": "list", "results": [copy.deepcopy(self.blocks[child_id]) for child_id in page_ids],
+                "next_cursor": next_cursor, "has_more": next_cursor is not None, "type": "block", "block": {}}
+
+    def append_children(self, block_id: str, children: list, after: str = None):
+        parent = self._get_block(block_id)
+        if not children or len(children) > MAX_PAGE_SIZE:
+            raise FakeNotionError(400, "validation_error", "body.children length should be between 1 and 100.")
+        child_ids = self.children.setdefault(block_id, [])
+        if after is not None and after not in child_ids:
+            raise FakeNotionError(400, "validation_error", f"Block {after} is not a child of {block_id}.")
+        insert_at = child_ids.index(after) + 1 if after is not None else len(child_ids)
+        tail = child_ids[insert_at:]
+        del child_ids[insert_at:]
+        created = self._add_children(block_id, children)
+        child_ids.extend(tail)
+        for block in created: self._touch(block)
+        parent["has_children"] = True
+        return {"object": "list", "results": [copy.deepcopy(block) for block in created],
+                "next_cursor": None, "has_more": False, "type": "block", "block": {}}
+
+    def update_block(self, block_id: str, data: dict):
+        block = self._get_block(block_id)
+        for key, value in data.items():
+            if key == "archived":
+                block["archived"] = bool(value)
+                continue
+            if key != block["type"]:
+                raise FakeNotionError(400, "validation_error",
+                                      f"Block type {block['type']} cannot be updated with {key} data.")
+            block[key].update(copy.deepcopy(value))
+        self._fill_block_rich_text(block)
+        self._touch(block)
+        return copy.deepcopy(block)
+
+    def _page_object(self, page_id: str):
+        page = self.blocks[page_id]
+        title = page["child_page"]["title"]
+        return {"object": "page", "id": page_id, "archived": page["archived"], "parent": page["parent"],
+                "last_edited_time": page["last_edited_time"],
+                "properties": {"title": {"id": "title", "type": "title",
+                                         "title": self._fill_rich_text([{"type": "text", "text": {"content": title}}])}}}
+
+    def _paginate(self, item_ids: list, start_cursor: str, page_size: int, make_result):
+        page_size = max(1, min(MAX_PAGE_SIZE, page_size))
+        start = 0
+        if start_cursor:
+            if start_cursor not in item_ids:
+                raise FakeNotionError(400, "validation_error", f"start_cursor {start_cursor} is not valid.")
+            start = item_ids.index(start_cursor)
+        next_cursor = item_ids[start + page_size] if start + page_size < len(item_ids) else None
+        return {"object": "list", "results": [make_result(item_id) for item_id in item_ids[start:start + page_size]],
+                "next_cursor": next_cursor, "has_more": next_cursor is not None}
+
+    def query_database(self, database_id: str, start_cursor: str = None, page_size: int = MAX_PAGE_SIZE):
+        database = self.databases.get(database_id)
+        if database is None:
+            raise FakeNotionError(404, "object_not_found", f"Could not find database with ID: {database_id}.")
+        page_ids = [page_id for page_id in database["page_ids"] if not self.blocks[page_id]["archived"]]
+        return {**self._paginate(page_ids, start_cursor, page_size, self._page_object), "type": "page_or_database"}
+
+    def search(self, query: str = "", filter: dict = None, start_cursor: str = None, page_size: int = MAX_PAGE_SIZE):
+        # Sólo se indexan páginas: un filtro por bases de datos devuelve una lista vacía.
+        if filter and filter.get("value") != "page":
+            page_ids = []
+        else:
+            page_ids = [block_id for block_id, block in self.blocks.items()
+                        if block["type"] == "child_page" and not block["archived"]
+                        and query.lower() in block["child_page"]["title"].lower()]
+        return {**self._paginate(page_ids, start_cursor, page_size, self._page_object), "type": "page_or_database"}
+
+    def delete_block(self, block_id: str):
+        block = self._get_block(block_id)
+        block["archived"] = True
+        parent_id = block.get("parent", {}).get("block_id")
+        if parent_id in self.children and block_id in self.children[parent_id]:
+            self.children[parent_id].remove(block_id)
+            self.blocks[parent_id]["has_children"] = bool(self.children[parent_id])
+        self._touch(block)
+        return copy.deepcopy(block)
+
+    # --- Inyección de latencia, límites y fallos ---
+
+    def inject_failure(self, endpoint: str, status: int = 502, applied: bool = False, times: int = 1,
+                       block_id: str = None):
+        """Hace fallar las próximas `times` peticiones a `endpoint` (p. ej. "DELETE /v1/blocks/{id}").
+
+        Con `applied` la operación se aplica igualmente antes de responder con el error: simula
+        una respuesta perdida (un timeout o un 502 de un proxy) tras una escritura que Notion sí
+        hizo. `block_id` limita el fallo a las peticiones sobre ese bloque.
+        """
+        self.injected_failures.append({"endpoint": endpoint, "status": status, "applied": applied,
+                                       "times": times, "block_id": block_id})
+
+    def _take_injected_failure(self, endpoint: str, block_id: str):
+        for failure in self.injected_failures:
+            if failure["endpoint"] == endpoint and failure["times"] > 0 and failure["block_id"] in (None, block_id):
+                failure["times"] -= 1
+                return failure
+        return None
+
+    def _should_rate_limit(self):
+        if self.rate_limit_probability and self._random.random() < self.rate_limit_probability:
+            return True
+        if self.requests_per_second:
+            # Ventana fija de un segundo, suficiente para provocar 429 realistas.
+            now = time.monotonic()
+            if now - self._window_start >= 1:
+                self._window_start, self._window_count = now, 0
+            self._window_count += 1
+            return self._window_count > self.requests_per_second
+        return False
+
+    def handle(self, method: str, path: str, query: dict, body: dict):
+        """Despacha una petición y devuelve (status, cuerpo JSON, cabeceras extra)."""
+        if self.latency_ms or self.jitter_ms:
+            time.sleep((self.latency_ms + self._random.uniform(0, self.jitter_ms)) / 1000)
+        with self._lock:
+            if path == "/__stats":
+                return 200, dict(self.stats), {}
+            match = BLOCK_PATH_PATTERN.match(path)
+            database_match = DATABASE_QUERY_PATH_PATTERN.match(path)
+            if match is not None:
+                endpoint = f"{method} /v1/blocks/{{id}}{'/children' if match.group('children') else ''}"
+            elif database_match is not None:
+                endpoint = f"{method} /v1/databases/{{id}}/query"
+            elif path == "/v1/search":
+                endpoint = f"{method} /v1/search"
+            else:
+                return 400, _error_body(400, "invalid_request_url", f"Invalid request URL: {path}"), {}
+            self.stats[endpoint] += 1
+            if self._should_rate_limit():
+                self.stats["rate_limited"] += 1
+                return (429, _error_body(429, "rate_limited", "You have been rate limited."),
+                        {"Retry-After": str(self.retry_after_seconds)})
+            failure = self._take_injected_failure(endpoint, match.group("block_id") if match is not None else None)
+            if failure is not None:
+                self.stats["injected_failures"] += 1
+                if failure["applied"]:
+                    self._dispatch(method, path, match, database_match, query, body)
+                return failure["status"], _error_body(failure["status"], "internal_server_error", "Injected failure."), {}
+            return self._dispatch(method, path, match, database_match, query, body)
+
+    def _dispatch(self, method: str, path: str, match, database_match, query: dict, body: dict):
+        try:
+            if database_match is not None and method == "POST":
+                return 200, self.query_database(database_match.group("database_id"), body.get("start_cursor"),
+                                                int(body.get("page_size", MAX_PAGE_SIZE))), {}
+            if match is None and method == "POST":
+                return 200, self.search(body.get("query", ""), body.get("filter"), body.get("start_cursor"),
+                                        int(body.get("page_size", MAX_PAGE_SIZE))), {}
+            if match is not None:
+                block_id = match.group("block_id")
+                if match.group("children"):
+                    if method == "GET":
+                        return 200, self.list_children(block_id, query.get("start_cursor"),
+                                                       int(query.get("page_size", MAX_PAGE_SIZE))), {}
+                    if method == "PATCH":
+                        return 200, self.append_children(block_id, body.get("children", []), body.get("after")), {}
+                elif method == "GET":
+                    return 200, self.retrieve_block(block_id), {}
+                elif method == "PATCH":
+                    return 200, self.update_block(block_id, body), {}
+                elif method == "DELETE":
+                    return 200, self.delete_block(block_id), {}
+        except FakeNotionError as error:
+            return error.status, _error_body(error.status, error.code, error.message), {}
+        return 400, _error_body(400, "invalid_request", f"Unsupported method {method} for {path}"), {}
+
+
+def _error_body(status: int, code: str, message: str):
+    return {"object": "error", "status": status, "code": code, "message": message}
+
+
+def make_request_handler(workspace: FakeNotionWorkspace):
+    class FakeNotionRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _dispatch(self, method: str):
+            url = urlparse(self.path)
+            query = {key: values[0] for key, values in parse_qs(url.query).items()}
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+            status, response_body, headers = workspace.handle(method, url.path, query, body)
+            payload = json.dumps(response_body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for header, value in headers.items():
+                self.send_header(header, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self): self._dispatch("GET")
+        def do_POST(self): self._dispatch("POST")
+        def do_PATCH(self): self._dispatch("PATCH")
+        def do_DELETE(self): self._dispatch("DELETE")
+
+        def log_message(self, format, *args):
+            pass
+
+    return FakeNotionRequestHandler
+
+
+def start_fake_notion_server(workspace: FakeNotionWorkspace, host: str = "127.0.0.1", port: int = 0):
+    """Arranca el servidor en un hilo en segundo plano y devuelve (servidor, base_url)."""
+    server = ThreadingHTTPServer((host, port), make_request_handler(workspace))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{server.server_address[0]}:{server.server_address[1]}"
+
+
+# --- Fixtures ---
+
+def _text_block(block_type: str, text: str, children: list = None):
+    block = {"type": block_type, block_type: {"rich_text": [{"type": "text", "text": {"content": text}}]}}
+    if children: block["children"] = children
+    return block
+
+
+def generate_page_blocks(n_blocks: int, seed: int = 0, katex_ratio: float = 0.3):
+    """Genera una página sintética con párrafos, listas, toggles anidados y tablas."""
+    rng = random.Random(seed)
+    expressions = [r"x^2 + y^2 = z^2", r"\frac{a}{b}", r"\int_0^1 f(x)\,dx", r"\sum_{k=1}^{n} k", r"e^{i\pi} + 1 = 0"]
+
+    def text():
+        roll = rng.random()
+        if roll < katex_ratio / 2:
+            return f"Sea ${rng.choice(expressions)}$ la ecuación del apartado {rng.randint(1, 99)}."
+        if roll < katex_ratio:
+            return f"Tenemos\n$${rng.choice(expressions)}$$\ny por tanto ${rng.choice(expressions)}$."
+        return f"Texto de apuntes sin ecuaciones, línea {rng.randint(1, 10_000)}."
+
+    blocks = []
+    while len(blocks) < n_blocks:
+        roll = rng.random()
+        if roll < 0.6:
+            blocks.append(_text_block(rng.choice(["paragraph", "paragraph", "heading_2", "quote"]), text()))
+        elif roll < 0.8:
+            blocks.append(_text_block("bulleted_list_item", text(),
+                                      [_text_block("bulleted_list_item", text()) for _ in range(rng.randint(0, 3))]))
+        elif roll < 0.95:
+            blocks.append(_text_block("toggle", text(), [_text_block("paragraph", text()) for _ in range(rng.randint(1, 4))]))
+        else:
+            rows = [{"type": "table_row", "table_row": {"cells": [
+                [{"type": "text", "text": {"content": text()}}] for _ in range(3)]}} for _ in range(rng.randint(2, 8))]
+            blocks.append({"type": "table", "table": {"table_width": 3, "has_column_header": False,
+                                                      "has_row_header": False}, "children": rows})
+    return blocks
+
+
+def record_page_fixture(page_id: str, notion_api_key: str, output_path: str):
+    """Graba el árbol de bloques de una página real en formato fixture."""
+    from notion_client import Client
+    from notion_client.helpers import iterate_paginated_api
+
+    notion_client = Client(auth=notion_api_key)
+
+    def fetch_tree(block_id: str):
+        blocks = []
+        for page in iterate_paginated_api(notion_client.blocks.children.list, block_id=block_id):
+            for block in page:
+                if block.get("has_children") and block.get("type") not in ("child_page", "child_database"):
+                    block["children"] = fetch_tree(block["id"])
+                blocks.append(block)
+        return blocks
+
+    fixture = {"pages": [{"id": page_id, "blocks": fetch_tree(page_id)}]}
+    with open(output_path, "w", encoding="utf-8") as fixture_file:
+        json.dump(fixture, fixture_file, indent=2, ensure_ascii=False)
+
+
+def build_workspace_from_arguments(args):
+    workspace = FakeNotionWorkspace(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                    rate_limit_probability=args.rate_limit_probability,
+                                    requests_per_second=args.requests_per_second, seed=args.seed)
+    if args.fixture:
+        with open(args.fixture, encoding="utf-8") as fixture_file:
+            workspace.load_fixture(json.load(fixture_file))
+    if args.generate_blocks:
+        # Con varias páginas, todas se agrupan en una base de datos sintética (--database-id).
+        database_id = args.database_id if args.generate_pages > 1 else None
+        for page_index in range(args.generate_pages):
+            page_id = args.page_id if page_index == 0 else str(uuid.uuid5(uuid.NAMESPACE_URL, f"{args.page_id}/{page_index}"))
+            workspace.add_page(page_id, generate_page_blocks(args.generate_blocks, seed=(args.seed or 0) + page_index),
+                               title=f"Apuntes {page_index + 1}", database_id=database_id)
+    return workspace
+
+
+def add_workspace_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--fixture", help="fichero JSON con las páginas a servir")
+    parser.add_argument("--generate-blocks", type=int, default=0, help="genera una página sintética con N bloques")
+    parser.add_argument("--generate-pages", type=int, default=1,
+                        help="número de páginas sintéticas de --generate-blocks bloques cada una")
+    parser.add_argument("--page-id", default="00000000-0000-0000-0000-000000000001",
+                        help="ID de la (primera) página sintética generada")
+    parser.add_argument("--database-id", default="00000000-0000-0000-0000-0000000000db",
+                        help="ID de la base de datos que agrupa las páginas sintéticas")
+    parser.add_argument("--latency-ms", type=float, default=0, help="latencia añadida a cada petición")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="latencia aleatoria adicional (máximo)")
+    parser.add_argument("--rate-limit-probability", type=float, default=0,
+                        help="probabilidad de responder 429 a cualquier petición")
+    parser.add_argument("--requests-per-second", type=float, default=0,
+                        help="responde 429 cuando se supera este ritmo (0 = sin límite)")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve", help="sirve un workspace falso")
+    add_workspace_arguments(serve_parser)
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    record_parser = subparsers.add_parser("record", help="graba una página real como fixture")
+    record_parser.add_argument("page_id")
+    record_parser.add_argument("output")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        import os
+        from dotenv import load_dotenv
+        load_dotenv()
+        record_page_fixture(args.page_id, os.getenv("NOTION_API_KEY"), args.output)
+        print(f"Fixture guardado en {args.output}")
+        return
+
+    workspace = build_workspace_from_arguments(args)
+    server = ThreadingHTTPServer((args.host, args.port), make_request_handler(workspace))
+    print(f"Servidor Notion falso en http://{args.host}:{args.port} ({len(workspace.blocks)} bloques)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
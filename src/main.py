@@ -1,7 +1,21 @@
+import argparse
+import asyncio
+import json
+import logging
 import os
 import re
-from notion_client import Client
+import sys
 import time
+from dataclasses import dataclass, field
+from typing import Optional
+from notion_client import APIErrorCode, APIResponseError, AsyncClient
+
+from batch_runner import BatchProgress, collect_page_ids, read_page_ids_file, run_worker_pool
+from logging_config import LOGGER_NAME, configure_logging
+from metrics import RunMetrics
+from notion_scheduler import NotionRequestScheduler
+from run_journal import RunJournal
+from state_store import BlockStateStore, hash_text
 
 # --- Configuración --- 
 from dotenv import load_dotenv
@@ -9,8 +23,41 @@ import os
 
 load_dotenv()  # Carga las variables desde .env
 
+logger = logging.getLogger(LOGGER_NAME)
+
 NOTION_API_KEY = os.getenv("NOTION_API_KEY")
 PAGE_ID_TO_PROCESS = os.getenv("PAGE_ID_TO_PROCESS")
+# URL base de la API (p. ej. la del servidor local de src/fake_notion_server.py).
+NOTION_BASE_URL = os.getenv("NOTION_BASE_URL", "https://api.notion.com")
+# Número máximo de peticiones a la API de Notion en vuelo al mismo tiempo.
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "3"))
+# Ritmo medio permitido por Notion (~3 peticiones/s) y tamaño máximo de las ráfagas.
+NOTION_REQUESTS_PER_SECOND = float(os.getenv("NOTION_REQUESTS_PER_SECOND", "3"))
+NOTION_BURST_SIZE = int(os.getenv("NOTION_BURST_SIZE", "10"))
+# Límite de Notion de bloques hijos por llamada a blocks.children.append.
+MAX_CHILDREN_PER_APPEND = 100
+# Ruta de la base de datos SQLite del modo incremental (vacío = desactivado).
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "")
+# Tamaño (en bloques) de las colas entre las etapas lectura -> planificación -> escritura, y
+# número máximo de niveles (subárboles o tablas) procesándose a la vez. Juntos acotan la memoria.
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "200"))
+MAX_ACTIVE_SUBTREES = int(os.getenv("MAX_ACTIVE_SUBTREES", "32"))
+# Subárboles lanzados por un mismo nivel que aún no han terminado (en marcha o esperando hueco):
+# al alcanzarlo, el nivel deja de leer hasta que alguno termine.
+MAX_PENDING_SUBTREES = int(os.getenv("MAX_PENDING_SUBTREES", "128"))
+# Actualizaciones de filas de una misma tabla en vuelo a la vez (el ritmo global lo sigue
+# marcando el planificador de peticiones).
+TABLE_ROW_UPDATES_IN_FLIGHT = int(os.getenv("TABLE_ROW_UPDATES_IN_FLIGHT", "16"))
+# Directorio de los journals de escritura adelantada que permiten reanudar con --resume.
+JOURNAL_DIR = os.getenv("JOURNAL_DIR", ".katex_journal")
+# Páginas procesadas a la vez en el modo por lotes (todas comparten el mismo ritmo de API).
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4"))
+# Nivel y formato ("text" o "json") de los logs, que se escriben en stderr.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+# Fichero donde exportar las métricas al terminar ("" = sólo un resumen en el log) y su formato.
+METRICS_OUTPUT = os.getenv("METRICS_OUTPUT", "")
+METRICS_FORMAT = os.getenv("METRICS_FORMAT", "json")
 
 
 TEXT_BEARING_BLOCK_TYPES = [
@@ -18,8 +65,13 @@ TEXT_BEARING_BLOCK_TYPES = [
     "bulleted_list_item", "numbered_list_item",
     "to_do", "toggle", "quote", "callout"
 ]
+# Bloques cuyos hijos se recorren (y en los que, por tanto, también se encuentran tablas).
+# child_page y child_database quedan fuera: son páginas aparte. Los synced_block sólo se
+# recorren en su original (ver should_process_children).
 RECURSIVE_CHILD_BEARING_TYPES = [
-    "bulleted_list_item", "numbered_list_item", "to_do", "toggle"
+    "bulleted_list_item", "numbered_list_item", "to_do", "toggle",
+    "paragraph", "heading_1", "heading_2", "heading_3", "quote", "callout",
+    "column_list", "column", "synced_block"
 ]
 
 # --- Funciones Auxiliares (las mismas que antes, asegúrate de que estén completas) ---
@@ -27,40 +79,61 @@ def get_plain_text_from_rich_text(rich_text_list):
     if rich_text_list is None: return ""
     return "".join([rt.get("plain_text", "") for rt in rich_text_list])
 
-def parse_text_for_inline_katex(text: str):
-    parts = re.split(r'(\$(?!\$)[^$]*?\$(?<!\$\$))', text) 
-    if len(parts) == 1: return None
+# Tokenizador de KaTeX: una única regex precompilada. Los contenidos usan el patrón
+# "unrolled loop" ([^$\\]* intercalado con escapes o $ sueltos), en el que cada carácter sólo
+# puede encajar de una forma: no hay backtracking catastrófico y el análisis es lineal.
+# Antes de recorrer una ecuación en bloque se comprueba con una búsqueda perezosa (mucho más
+# rápida en `re`) que hay un `$$` más adelante: así un `$$` sin cerrar no obliga a recorrer y
+# deshacer el bucle de la ecuación hasta el final del texto.
+KATEX_TOKEN_PATTERN = re.compile(r"""
+    \\\$                                                       # \$ escapado: texto literal
+  | \$\$(?=[\s\S]*?\$\$)                                       # $$ecuación en bloque$$
+    (?P<block>[^$\\]*(?:(?:\\[\s\S]|\$(?!\$))[^$\\]*)*)\$\$        #   (sólo si se cierra)
+  | \$(?P<inline>[^$\\]*(?:\\[\s\S][^$\\]*)*)\$                   # $ecuación inline$
+""", re.VERBOSE)
+
+def segment_katex_text(text: str):
+    """Tokeniza `text` en una sola pasada: ('text' | 'katex' | 'block_katex', contenido, inicio, fin).
+
+    - `$$...$$` es una ecuación en bloque (puede contener `$` sueltos).
+    - `$...$` es una ecuación inline (sin `$` dentro).
+    - `\\$` nunca es un delimitador y se conserva tal cual en el texto.
+    - Las ecuaciones vacías y los delimitadores sin cerrar se quedan como texto.
+
+    Los desplazamientos se refieren a `text`, de modo que los segmentos de texto pueden
+    recortarse del rich_text original conservando sus anotaciones.
+    """
+    if '$' not in text:
+        return [('text', text, 0, len(text))] if text else []
     segments = []
-    has_katex_segment = False
-    for part_content in parts:
-        if not part_content: continue
-        is_inline_katex = part_content.startswith("$") and part_content.endswith("$") and \
-                          not part_content.startswith("$$") and not part_content.endswith("$$") and \
-                          len(part_content) > 2 
-        if is_inline_katex:
-            expression = part_content[1:-1].strip()
-            if expression: 
-                segments.append(('katex', expression))
-                has_katex_segment = True
+    text_start = 0
+    for match in KATEX_TOKEN_PATTERN.finditer(text):
+        expression = match.group('block')
+        if expression is not None:
+            seg_type = 'block_katex'
         else:
-            if part_content or (segments and segments[-1][0] == 'katex'):
-                 segments.append(('text', part_content))
-    return segments if has_katex_segment and not all(s[0] == 'text' for s in segments) else None
+            expression = match.group('inline')
+            if expression is None: continue  # \$ escapado
+            seg_type = 'katex'
+        expression = expression.strip()
+        if not expression: continue
+        start, end = match.span()
+        if start > text_start:
+            segments.append(('text', text[text_start:start], text_start, start))
+        segments.append((seg_type, expression, start, end))
+        text_start = end
+    if len(text) > text_start:
+        segments.append(('text', text[text_start:], text_start, len(text)))
+    return segments
 
 def create_equation_block_payload(katex_expression: str):
     return {"object": "block", "type": "equation", "equation": {"expression": katex_expression}}
 
 def create_paragraph_block_payload_from_rich_text_list(rich_text_list: list):
-    if not rich_text_list or not any(rt.get("text", {}).get("content", "").strip() or rt.get("type") == "equation" for rt in rich_text_list):
+    if not rich_text_list or not any(rt.get("text", {}).get("content", "").strip() or rt.get("type") in ("equation", "mention") for rt in rich_text_list):
         return None
     return {"object": "block", "type": "paragraph", "paragraph": {"rich_text": rich_text_list}}
 
-def create_paragraph_block_payload_from_plain_text(plain_text: str):
-    stripped_plain_text = plain_text.strip()
-    if not stripped_plain_text: return None
-    return {"object": "block", "type": "paragraph", 
-            "paragraph": {"rich_text": [{"type": "text", "text": {"content": stripped_plain_text}}]}}
-
 def get_rich_text_list_from_block_data(block_data):
     block_type = block_data.get("type")
     if block_type in TEXT_BEARING_BLOCK_TYPES:
@@ -68,275 +141,907 @@ def get_rich_text_list_from_block_data(block_data):
         return type_specific_data.get("rich_text")
     return None
 
-def process_simple_table_rows(table_block_id: str, depth: int, notion_client: Client):
-    # (Esta función se mantiene igual que la última versión que te di)
-    # ... (código de process_simple_table_rows de la respuesta anterior) ...
-    # Asegúrate de que esta función esté completa aquí.
-    indent = "  " * depth
-    print(f"{indent}DEBUG (Tabla): Procesando filas de la tabla ID: {table_block_id}")
-    table_rows_children = []
+# --- Planificador de mutaciones ---
+# En lugar de borrar y recrear cada bloque con KaTeX, se calcula el conjunto mínimo de
+# operaciones: el bloque original se reutiliza (blocks.update) para su primer segmento de
+# texto, conservando ID, tipo, anotaciones e hijos, y sólo se insertan los segmentos restantes.
+# Cada operación es un dict serializable:
+#   {"op": "insert_before", "children": [...]}  -> children.append tras el hermano anterior
+#   {"op": "insert_after", "children": [...]}   -> children.append tras el bloque original
+#   {"op": "update", "block_id": ..., "data": {...}, "expected_plain_text": ...}
+#   {"op": "delete", "block_id": ...}
+# Las inserciones van siempre primero y la actualización (que recorta el texto del original)
+# o el borrado al final: si una escritura falla puede quedar un duplicado, pero nunca se
+# pierde texto.
+
+def _rich_text_item_plain_text(rich_text_item: dict):
+    if "plain_text" in rich_text_item: return rich_text_item["plain_text"]
+    item_type = rich_text_item.get("type")
+    if item_type == "text": return rich_text_item.get("text", {}).get("content", "")
+    if item_type == "equation": return rich_text_item.get("equation", {}).get("expression", "")
+    return ""
+
+def _to_request_rich_text_item(rich_text_item: dict, content: str = None):
+    # Convierte un objeto rich_text leído de la API al formato de escritura
+    # (sin plain_text/href, que son de sólo lectura).
+    item_type = rich_text_item.get("type")
+    if item_type == "text":
+        text_data = {"content": rich_text_item.get("text", {}).get("content", "") if content is None else content}
+        if rich_text_item.get("text", {}).get("link"): text_data["link"] = rich_text_item["text"]["link"]
+        request_item = {"type": "text", "text": text_data}
+    else:
+        request_item = {"type": item_type, item_type: rich_text_item.get(item_type)}
+    if rich_text_item.get("annotations"): request_item["annotations"] = rich_text_item["annotations"]
+    return request_item
+
+def _iter_rich_text_slices(rich_text_list: list, start: int, end: int):
+    # (objeto original, su plain_text dentro del rango) de cada objeto que cubre
+    # plain_text[start:end]. Los objetos de texto se recortan; las menciones y ecuaciones son
+    # atómicas y se incluyen enteras si empiezan dentro del rango.
+    offset = 0
+    for rich_text_item in rich_text_list:
+        item_text = _rich_text_item_plain_text(rich_text_item)
+        item_start, item_end = offset, offset + len(item_text)
+        offset = item_end
+        if item_end <= start or item_start >= end: continue
+        if rich_text_item.get("type") == "text":
+            piece = item_text[max(start, item_start) - item_start:min(end, item_end) - item_start]
+            if piece: yield rich_text_item, piece
+        elif start <= item_start < end:
+            yield rich_text_item, item_text
+
+def _iter_segment_pieces(segments: list, rich_text_original: list, trim: bool):
+    # (objeto rich_text original, plain_text) de cada pieza de un grupo de segmentos; las
+    # ecuaciones inline no tienen objeto original (None) y su plain_text es la expresión.
+    last_index = len(segments) - 1
+    for index, (seg_type, content, start, end) in enumerate(segments):
+        if seg_type == 'text':
+            if trim and index == 0: start += len(content) - len(content.lstrip())
+            if trim and index == last_index: end -= len(content) - len(content.rstrip())
+            if start < end: yield from _iter_rich_text_slices(rich_text_original, start, end)
+        else:
+            yield None, content
+
+def build_rich_text_from_segments(segments: list, rich_text_original: list, trim: bool = False,
+                                  read_format: bool = False):
+    """Construye el rich_text de un grupo de segmentos de texto / KaTeX inline.
+
+    Los objetos de texto se recortan conservando anotaciones y enlaces. Con `trim` se
+    eliminan los espacios y saltos de línea en los extremos del grupo (los que rodeaban a una
+    ecuación en bloque). Por defecto el resultado está en formato de escritura; con
+    `read_format` cada objeto conserva además el plain_text y el href de su original, como
+    los devuelve children.list (lo usa el conversor offline).
+    """
+    rich_text_list = []
+    for rich_text_item, piece in _iter_segment_pieces(segments, rich_text_original, trim):
+        if rich_text_item is None:
+            new_item = {"type": "equation", "equation": {"expression": piece}}
+        else:
+            new_item = _to_request_rich_text_item(rich_text_item, piece if rich_text_item.get("type") == "text" else None)
+        if read_format:
+            new_item["plain_text"] = piece
+            new_item["href"] = rich_text_item.get("href") if rich_text_item is not None else None
+        rich_text_list.append(new_item)
+    return rich_text_list
+
+def build_plain_text_from_segments(segments: list, rich_text_original: list, trim: bool = False):
+    """plain_text que tendrá en Notion el rich_text de build_rich_text_from_segments.
+
+    Sale de los desplazamientos y el plain_text leídos de la API (una mención aporta su
+    "@nombre"), así que puede compararse con el texto del bloque tal como se lea después.
+    """
+    return "".join(piece for _, piece in _iter_segment_pieces(segments, rich_text_original, trim))
+
+def _group_segments_by_block(segments: list):
+    # Agrupa segmentos consecutivos de texto/inline (un bloque de texto cada grupo) y deja
+    # cada ecuación en bloque como grupo propio.
+    groups = []
+    for segment in segments:
+        if segment[0] == 'block_katex':
+            groups.append(('equation', segment))
+        elif groups and groups[-1][0] == 'rich_text':
+            groups[-1][1].append(segment)
+        else:
+            groups.append(('rich_text', [segment]))
+    return groups
+
+def _normalize_rich_text_for_comparison(rich_text_list: list):
+    return [_to_request_rich_text_item(rich_text_item) for rich_text_item in rich_text_list]
+
+def _block_update_data(block_data: dict, rich_text_list: list):
+    block_type = block_data["type"]
+    update_data = {block_type: {"rich_text": rich_text_list}}
+    type_specific_content_original = block_data.get(block_type, {})
+    if block_type == "to_do" and "checked" in type_specific_content_original:
+        update_data[block_type]["checked"] = type_specific_content_original["checked"]
+    return update_data
+
+def plan_block_mutations(block_data: dict, has_previous_sibling: bool, read_format: bool = False):
+    """Calcula las operaciones mínimas para renderizar el KaTeX de un bloque de texto.
+
+    Devuelve una lista vacía si el bloque no necesita cambios. `has_previous_sibling` indica
+    si existe un ancla para insertar ecuaciones delante del bloque original. Con `read_format`
+    el rich_text de las operaciones va en formato de lectura (ver build_rich_text_from_segments).
+    """
+    block_id = block_data["id"]
+    rich_text_original = get_rich_text_list_from_block_data(block_data)
+    if not rich_text_original: return []
+    plain_text = get_plain_text_from_rich_text(rich_text_original)
+    if '$' not in plain_text: return []
+    segments = segment_katex_text(plain_text)
+    if all(segment[0] == 'text' for segment in segments): return []
+
+    has_block_katex = any(segment[0] == 'block_katex' for segment in segments)
+    # Un bloque con hijos nunca se elimina (se perderían sus hijos): si sus ecuaciones en
+    # bloque no pueden colocarse como hermanos, se renderizan como ecuaciones inline.
+    groups = _group_segments_by_block(segments)
+    payloads = []
+    for group_type, group_content in groups:
+        if group_type == 'equation':
+            payloads.append(create_equation_block_payload(group_content[1]))
+        else:
+            payloads.append(create_paragraph_block_payload_from_rich_text_list(
+                build_rich_text_from_segments(group_content, rich_text_original, trim=has_block_katex,
+                                              read_format=read_format)))
+    first_text_index = next((index for index, payload in enumerate(payloads)
+                             if payload is not None and payload["type"] == "paragraph"), None)
+    can_reuse_original = first_text_index is not None and (first_text_index == 0 or has_previous_sibling)
+
+    if not has_block_katex or (not can_reuse_original and block_data.get("has_children")):
+        inline_segments = [('katex',) + segment[1:] if segment[0] == 'block_katex' else segment
+                           for segment in segments]
+        new_rich_text = build_rich_text_from_segments(inline_segments, rich_text_original, read_format=read_format)
+        if not new_rich_text or \
+           _normalize_rich_text_for_comparison(new_rich_text) == _normalize_rich_text_for_comparison(rich_text_original):
+            return []
+        return [{"op": "update", "block_id": block_id, "data": _block_update_data(block_data, new_rich_text),
+                 "expected_plain_text": build_plain_text_from_segments(inline_segments, rich_text_original)}]
+
+    if not can_reuse_original:
+        # Sólo ecuaciones, o una ecuación inicial sin ancla delante: se insertan todos los
+        # segmentos tras el original y se elimina éste.
+        children = [payload for payload in payloads if payload is not None]
+        return [{"op": "insert_after", "children": children}, {"op": "delete", "block_id": block_id}]
+
+    operations = []
+    children_before = [payload for payload in payloads[:first_text_index] if payload is not None]
+    children_after = [payload for payload in payloads[first_text_index + 1:] if payload is not None]
+    if children_before: operations.append({"op": "insert_before", "children": children_before})
+    if children_after: operations.append({"op": "insert_after", "children": children_after})
+    first_rich_text = payloads[first_text_index]["paragraph"]["rich_text"]
+    # El plain_text esperado tras la actualización se guarda con el plan: al reanudar permite
+    # reconocer que la actualización ya se aplicó aunque su respuesta no llegase.
+    expected_plain_text = build_plain_text_from_segments(groups[first_text_index][1], rich_text_original, trim=True)
+    operations.append({"op": "update", "block_id": block_id, "data": _block_update_data(block_data, first_rich_text),
+                       "expected_plain_text": expected_plain_text})
+    return operations
+
+def rich_text_contains_dollar(rich_text_list: list):
+    """Comprobación barata previa a segmentar: ¿algún fragmento de texto contiene '$'?
+
+    Las ecuaciones ya convertidas no cuentan (su plain_text es la expresión, sin '$').
+    """
+    for rich_text_item in rich_text_list or ():
+        if rich_text_item.get("type") != "equation" and '$' in _rich_text_item_plain_text(rich_text_item):
+            return True
+    return False
+
+def table_row_contains_dollar(row_block: dict):
+    return any(rich_text_contains_dollar(cell) for cell in row_block.get("table_row", {}).get("cells", []))
+
+def plan_table_row_update(row_block: dict, read_format: bool = False):
+    """Devuelve la operación de actualización de una fila de tabla, o None si no cambia.
+
+    En las celdas todas las ecuaciones (también las $$...$$) se renderizan inline. Con
+    `read_format` las celdas van en formato de lectura y las que no cambian, tal cual.
+    """
+    original_cells_data = row_block.get("table_row", {}).get("cells", [])
+    new_cells_data = []
+    row_was_modified = False
+    for cell_rich_text_list_original in original_cells_data:
+        new_cell_rich_text = None
+        if rich_text_contains_dollar(cell_rich_text_list_original):
+            cell_plain_text = get_plain_text_from_rich_text(cell_rich_text_list_original)
+            segments = [('katex',) + segment[1:] if segment[0] == 'block_katex' else segment
+                        for segment in segment_katex_text(cell_plain_text)]
+            if any(segment[0] == 'katex' for segment in segments):
+                new_cell_rich_text = build_rich_text_from_segments(segments, cell_rich_text_list_original,
+                                                                   read_format=read_format)
+        if new_cell_rich_text:
+            new_cells_data.append(new_cell_rich_text); row_was_modified = True
+        elif read_format:
+            new_cells_data.append(cell_rich_text_list_original)
+        else:
+            new_cells_data.append(_normalize_rich_text_for_comparison(cell_rich_text_list_original))
+    if not row_was_modified: return None
+    return {"op": "update", "block_id": row_block["id"], "data": {"table_row": {"cells": new_cells_data}}}
+
+@dataclass
+class RunContext:
+    """Estado compartido por todas las tareas de una ejecución."""
+    notion_client: AsyncClient
+    scheduler: NotionRequestScheduler
+    state_store: Optional[BlockStateStore] = None
+    journal: Optional[RunJournal] = None
+    # En modo dry-run no se escribe nada: las operaciones se acumulan en planned_operations
+    # (ID del bloque -> {"parent_id": ..., "operations": [...]}).
+    dry_run: bool = False
+    planned_operations: dict = field(default_factory=dict)
+    error_count: int = 0
+    blocks_scanned: int = 0
+    blocks_modified: int = 0
+    subtree_slots: asyncio.Semaphore = field(default_factory=lambda: asyncio.Semaphore(MAX_ACTIVE_SUBTREES))
+
+    @property
+    def metrics(self) -> RunMetrics:
+        return self.scheduler.metrics
+
+    def record_planned_operations(self, parent_block_id: str, block_id: str, operations: list):
+        self.planned_operations[block_id] = {"parent_id": parent_block_id, "operations": operations}
+
+def get_block_text_hash(block_data: dict):
+    if block_data.get("type") == "table_row":
+        cells = block_data.get("table_row", {}).get("cells", [])
+        return hash_text("\x1f".join(get_plain_text_from_rich_text(cell) for cell in cells))
+    return hash_text(get_plain_text_from_rich_text(get_rich_text_list_from_block_data(block_data)))
+
+def is_block_unchanged_since_last_run(block_data: dict, context: RunContext):
+    if context.state_store is None or not block_data.get("last_edited_time"): return False
+    return context.state_store.is_block_unchanged(
+        block_data["id"], block_data["last_edited_time"], get_block_text_hash(block_data))
+
+def record_block_state(block_data: dict, context: RunContext):
+    if context.state_store is None: return
+    context.state_store.record_block(
+        block_data["id"], block_data.get("last_edited_time"), get_block_text_hash(block_data))
+
+async def iter_children(block_id: str, context: RunContext):
+    """Devuelve los hijos de un bloque según llega cada página de children.list."""
     next_cursor = None
+    while True:
+        response = await context.scheduler.call(context.notion_client.blocks.children.list,
+                                                block_id=block_id, start_cursor=next_cursor, page_size=100)
+        for child in response.get("results", []):
+            yield child
+        next_cursor = response.get("next_cursor")
+        if not next_cursor: break
+
+# --- Pipeline en streaming ---
+# Cada nivel del árbol se procesa como una cadena de etapas (lectura -> planificación ->
+# escritura) unidas por colas acotadas: cada página de 100 bloques se procesa en cuanto llega
+# y ningún nivel guarda la lista completa de sus hijos.
+
+_END_OF_STREAM = object()
+
+class _StreamFailure:
+    def __init__(self, error: Exception):
+        self.error = error
+
+async def _feed_queue(items, queue: asyncio.Queue):
     try:
-        while True:
-            response = notion_client.blocks.children.list(block_id=table_block_id, start_cursor=next_cursor, page_size=100)
-            table_rows_children.extend(response.get("results", []))
-            next_cursor = response.get("next_cursor")
-            if not next_cursor: break
+        async for item in items:
+            await queue.put(item)
     except Exception as e:
-            print(f"{indent}DEBUG (Tabla): ERROR obteniendo filas para la tabla {table_block_id}: {e}"); return
-    for row_block in table_rows_children:
-        if row_block.get("type") == 'table_row':
-            row_id = row_block["id"]; original_cells_data = row_block.get('table_row', {}).get('cells', [])
-            new_cells_data_for_row = []; row_was_modified = False
-            print(f"{indent}DEBUG (Tabla):   Procesando Fila ID: {row_id}. Celdas: {len(original_cells_data)}")
-            for cell_index, cell_rich_text_list_original in enumerate(original_cells_data):
-                current_cell_plain_text = get_plain_text_from_rich_text(cell_rich_text_list_original)
-                print(f"{indent}DEBUG (Tabla):     Celda {cell_index+1} plain_text: '{current_cell_plain_text}'")
-                if '$' in current_cell_plain_text and not current_cell_plain_text.strip().startswith("$$"):
-                    segments = parse_text_for_inline_katex(current_cell_plain_text)
-                    print(f"{indent}DEBUG (Tabla):       Resultado de parse_text_for_inline_katex para celda: {segments}")
-                    if segments:
-                        new_cell_rich_text_payload = []; has_meaningful_content = False
-                        for seg_type, content in segments:
-                            if seg_type == 'text' and content: 
-                                new_cell_rich_text_payload.append({"type": "text", "text": {"content": content}})
-                                if content.strip(): has_meaningful_content = True
-                            elif seg_type == 'katex' and content: 
-                                new_cell_rich_text_payload.append({"type": "equation", "equation": {"expression": content}})
-                                has_meaningful_content = True
-                        if has_meaningful_content and new_cell_rich_text_payload:
-                            print(f"{indent}DEBUG (Tabla):       Celda {cell_index+1} será actualizada.")
-                            new_cells_data_for_row.append(new_cell_rich_text_payload); row_was_modified = True
-                        else: new_cells_data_for_row.append(cell_rich_text_list_original) 
-                    else: new_cells_data_for_row.append(cell_rich_text_list_original) 
-                else: new_cells_data_for_row.append(cell_rich_text_list_original) 
-            if row_was_modified:
-                try:
-                    notion_client.blocks.update(block_id=row_id, table_row={"cells": new_cells_data_for_row})
-                    print(f"{indent}DEBUG (Tabla):     Fila {row_id} actualizada exitosamente."); time.sleep(0.35)
-                except Exception as e: print(f"{indent}DEBUG (Tabla):     ERROR actualizando fila {row_id}: {e}")
+        await queue.put(_StreamFailure(e))
+        return
+    await queue.put(_END_OF_STREAM)
 
-# ------------------------------------------------------------------------------------
+async def _drain_queue(queue: asyncio.Queue):
+    while True:
+        item = await queue.get()
+        if item is _END_OF_STREAM: return
+        if isinstance(item, _StreamFailure): raise item.error
+        yield item
 
-def process_blocks_recursively(parent_block_id: str, notion_client: Client, depth=0):
-    indent = "  " * depth
-    print(f"{indent}DEBUG (Rec): Procesando hijos de parent_block_id: {parent_block_id}, Nivel: {depth}")
+def start_stage(items, stage_tasks: list):
+    """Ejecuta el iterable asíncrono `items` como etapa independiente y devuelve su salida."""
+    queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    stage_tasks.append(asyncio.create_task(_feed_queue(items, queue)))
+    return _drain_queue(queue)
 
-    current_level_blocks = []
-    next_cursor = None
+class SubtreeGroup:
+    """Tareas concurrentes lanzadas desde un nivel: subárboles o actualizaciones de filas de una tabla.
+
+    Las tareas terminadas se descartan enseguida para no acumularlas; sólo se recuerda si
+    alguna falló, que es lo que decide si el nivel se puede marcar como completo.
+    """
+
+    def __init__(self, context: RunContext):
+        self.context = context
+        self.failed = False
+        self._tasks = set()
+
+    def spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._on_done)
+
+    async def wait_for_capacity(self, max_pending: int):
+        """Espera a que haya menos de `max_pending` tareas sin terminar.
+
+        Se llama con un hueco de subtree_slots ocupado, que se cede mientras se espera: las
+        tareas pendientes lo necesitan para avanzar y, si no, los niveles podrían bloquearse
+        entre sí.
+        """
+        if len(self._tasks) < max_pending: return
+        self.context.subtree_slots.release()
+        try:
+            while len(self._tasks) >= max_pending:
+                await asyncio.wait(set(self._tasks), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            await self.context.subtree_slots.acquire()
+
+    def _on_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if task.cancelled():
+            self.failed = True
+        elif task.exception() is not None:
+            logger.error("Error inesperado en un subárbol: %s", task.exception())
+            self.context.error_count += 1
+            self.failed = True
+        elif task.result() is False:
+            self.failed = True
+
+    async def wait(self):
+        """Espera a los subárboles pendientes y devuelve True si todos terminaron sin errores."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        return not self.failed
+
+async def append_children_after(parent_block_id: str, children: list, after_block_id: str, context: RunContext,
+                                on_batch_created=None):
+    """Inserta `children` tras `after_block_id` en tan pocas llamadas como sea posible.
+
+    Envía lotes de hasta MAX_CHILDREN_PER_APPEND bloques, encadenando cada lote tras el
+    último bloque creado, y devuelve los IDs nuevos en orden. `on_batch_created` recibe los
+    IDs de cada lote en cuanto Notion confirma su creación.
+    """
+    created_block_ids = []
+    anchor_id = after_block_id
+    for start in range(0, len(children), MAX_CHILDREN_PER_APPEND):
+        batch = children[start:start + MAX_CHILDREN_PER_APPEND]
+        append_kwargs = {"block_id": parent_block_id, "children": batch}
+        if anchor_id: append_kwargs["after"] = anchor_id
+        response = await context.scheduler.call(context.notion_client.blocks.children.append,
+                                                idempotent=False, **append_kwargs)
+        batch_ids = [created["id"] for created in response["results"][:len(batch)]]
+        if on_batch_created is not None: on_batch_created(batch_ids)
+        created_block_ids.extend(batch_ids)
+        anchor_id = batch_ids[-1]
+    return created_block_ids
+
+async def process_simple_table_rows(table_block_id: str, depth: int, context: RunContext):
+    """Procesa las filas de una tabla: las lee en streaming y lanza sus actualizaciones en paralelo.
+
+    Las filas son independientes entre sí (no hay que encadenar `after`), así que hasta
+    TABLE_ROW_UPDATES_IN_FLIGHT actualizaciones pueden estar pendientes a la vez mientras se
+    siguen leyendo filas. Devuelve False si alguna lectura o actualización falló.
+    """
+    logger.debug("Procesando filas de la tabla %s (nivel %d)", table_block_id, depth)
+    if context.journal is not None and table_block_id in context.journal.done_subtrees:
+        logger.debug("Tabla %s ya completada en la ejecución anterior. Omitiendo.", table_block_id)
+        return True
+    table_succeeded = True
+    row_updates = SubtreeGroup(context)
+    row_update_slots = asyncio.Semaphore(TABLE_ROW_UPDATES_IN_FLIGHT)
+    stage_tasks = []
     try:
-        while True:
-            response = notion_client.blocks.children.list(block_id=parent_block_id, start_cursor=next_cursor, page_size=100)
-            current_level_blocks.extend(response.get("results", []))
-            next_cursor = response.get("next_cursor")
-            if not next_cursor: break
+        async with context.subtree_slots:
+            async for row_block in start_stage(iter_children(table_block_id, context), stage_tasks):
+                if row_block.get("type") != 'table_row': continue
+                operation = plan_table_row(table_block_id, row_block, context)
+                if operation is None: continue
+                await row_update_slots.acquire()
+                row_updates.spawn(update_table_row(row_block["id"], operation, context, row_update_slots))
     except Exception as e:
-        print(f"{indent}DEBUG (Rec): Error obteniendo bloques hijos de {parent_block_id}: {e}")
-        return None
-            
-    print(f"{indent}DEBUG (Rec): Encontrados {len(current_level_blocks)} bloques hijos para {parent_block_id}.")
-    last_successfully_placed_block_id_at_this_level = None
+        logger.error("Error obteniendo las filas de la tabla %s: %s", table_block_id, e, extra={"block_id": table_block_id})
+        context.error_count += 1
+        table_succeeded = False
+    finally:
+        for task in stage_tasks: task.cancel()
+    if not await row_updates.wait(): table_succeeded = False
+    if table_succeeded and context.journal is not None:
+        context.journal.record_subtree_done(table_block_id)
+    return table_succeeded
 
-    for i, original_block in enumerate(current_level_blocks):
-        block_id = original_block["id"]
-        block_type = original_block.get("type")
-        has_children = original_block.get("has_children", False)
+def plan_table_row(table_block_id: str, row_block: dict, context: RunContext):
+    """Devuelve la actualización de la fila, o None si no hay nada que escribir (o es dry-run)."""
+    row_id = row_block["id"]
+    context.blocks_scanned += 1
+    # La gran mayoría de filas no tiene '$': se descartan sin unir ni segmentar su texto.
+    if not table_row_contains_dollar(row_block): return None
+    if is_block_unchanged_since_last_run(row_block, context): return None
+    parse_started = time.perf_counter()
+    operation = plan_table_row_update(row_block)
+    context.metrics.parse_seconds += time.perf_counter() - parse_started
+    if operation is None:
+        record_block_state(row_block, context); return None
+    logger.debug("Fila %s será actualizada.", row_id)
+    if context.dry_run:
+        context.blocks_modified += 1
+        context.record_planned_operations(table_block_id, row_id, [operation]); return None
+    return operation
 
-        print(f"\n{indent}DEBUG (Rec): ---- Revisando bloque {i+1}/{len(current_level_blocks)} ----")
-        print(f"{indent}DEBUG (Rec):   ID: {block_id}, Tipo: {block_type}, TieneHijos: {has_children}")
+async def update_table_row(row_id: str, operation: dict, context: RunContext, row_update_slots: asyncio.Semaphore):
+    """Aplica la actualización de una fila y libera su hueco; devuelve False si falló."""
+    try:
+        # La actualización de una fila es idempotente: no necesita entrada en el journal.
+        updated_row = await context.scheduler.call(context.notion_client.blocks.update,
+                                                   block_id=row_id, **operation["data"])
+        record_block_state(updated_row, context)
+        # Sólo cuenta como modificada la fila cuya actualización se aplicó.
+        context.blocks_modified += 1
+        logger.debug("Fila %s actualizada.", row_id)
+        return True
+    except Exception as e:
+        logger.error("Error actualizando la fila %s: %s", row_id, e, extra={"block_id": row_id})
+        context.error_count += 1
+        return False
+    finally:
+        row_update_slots.release()
 
-        block_was_replaced_or_deleted = False
+def block_signature(block_data: dict):
+    """(tipo, texto) de un bloque leído de la API o de un payload de creación, para compararlos.
 
-        if block_type == "table": 
-            process_simple_table_rows(block_id, depth + 1, notion_client)
-            last_successfully_placed_block_id_at_this_level = block_id
-            continue 
+    Las menciones no cuentan: en un payload no tienen plain_text y Notion las lee como "@nombre".
+    """
+    block_type = block_data.get("type")
+    if block_type == "equation":
+        return block_type, block_data.get("equation", {}).get("expression", "")
+    rich_text_list = block_data.get(block_type, {}).get("rich_text") or []
+    return block_type, "".join(_rich_text_item_plain_text(rich_text_item) for rich_text_item in rich_text_list
+                               if rich_text_item.get("type") != "mention")
 
-        if block_type not in TEXT_BEARING_BLOCK_TYPES:
-            print(f"{indent}DEBUG (Rec):   Bloque de tipo '{block_type}' no es text-bearing. Omitiendo.")
-            if has_children and block_type in RECURSIVE_CHILD_BEARING_TYPES:
-                 print(f"{indent}DEBUG (Rec):   Pero tiene hijos y es recursivo. Llamando para ID: {block_id}")
-                 process_blocks_recursively(block_id, notion_client, depth + 1)
-            last_successfully_placed_block_id_at_this_level = block_id
-            continue
+async def find_adoptable_children(parent_block_id: str, after_block_id: str, expected_children: list,
+                                  context: RunContext):
+    """Busca tras `after_block_id` bloques iguales a `expected_children` (en orden).
 
-        rich_text_list_original = get_rich_text_list_from_block_data(original_block)
-        if rich_text_list_original is None:
-            print(f"{indent}DEBUG (Rec):   No se pudo extraer rich_text para '{block_type}'. Omitiendo.")
-            if has_children and block_type in RECURSIVE_CHILD_BEARING_TYPES:
-                 print(f"{indent}DEBUG (Rec):   Aun así, tiene hijos y es recursivo. Llamando para ID: {block_id}")
-                 process_blocks_recursively(block_id, notion_client, depth + 1)
-            last_successfully_placed_block_id_at_this_level = block_id
+    Sirve para reconocer los bloques de un children.append que Notion aplicó pero cuya
+    respuesta no llegó a registrarse en el journal antes de la interrupción.
+    """
+    if not after_block_id or not expected_children: return []
+    adopted_block_ids = []
+    anchor_found = False
+    async for child in iter_children(parent_block_id, context):
+        if not anchor_found:
+            anchor_found = child["id"] == after_block_id
             continue
-            
-        plain_text = get_plain_text_from_rich_text(rich_text_list_original)
-        print(f"{indent}DEBUG (Rec):   Contenido (plain_text): '{plain_text}'")
-
-        # NUEVA LÓGICA DE PROCESAMIENTO DE BLOQUES:
-        # Dividir el plain_text por ocurrencias de $$...$$
-        # La regex (\$\$[\s\S]+?\$\$) captura el bloque KaTeX incluyendo los delimitadores $$
-        # re.split mantendrá estos bloques KaTeX capturados en la lista resultante.
-        
-        # Asegurarse de que la expresión dentro de $$...$$ no sea solo espacios
-        # y que los $$ no estén uno al lado del otro como $$$$ (que no es un bloque válido)
-        # La regex r"(\$\$(?!\s*\$\$)[\s\S]*?\$\$)" intenta ser más específica:
-        #   \$\$            -> literal $$
-        #   (?!\s*\$\$)    -> negativa hacia adelante: no seguido por (cero o más espacios y luego $$) - evita $$$$
-        #   [\s\S]*?       -> cualquier caracter, incluyendo saltos de línea, no codicioso
-        #   \$\$            -> literal $$ de cierre
-        # Esta regex es para el split.
-        # La validación del contenido interno se hará después de extraerlo.
-
-        # Regex para split: (\$\$[\s\S]+?\$\$) - captura $$equation$$
-        #   [\s\S] permite saltos de línea dentro de la ecuación.
-        #   +? no codicioso, para que cada ecuación se capture individualmente.
-        # Si no hay $$...$$, parts tendrá un solo elemento (el plain_text original).
-        parts = re.split(r"(\$\$[\s\S]+?\$\$)", plain_text)
-        
-        new_blocks_payloads_for_this_original_block = []
-        original_block_content_changed = False
-
-        if len(parts) > 1 or (len(parts) == 1 and parts[0].startswith("$$") and parts[0].endswith("$$") and parts[0].count("$$") == 2) : # Hay algo que procesar (o es todo un bloque $$)
-            print(f"{indent}DEBUG (Rec):   Analizando partes divididas por $$...$$: {len(parts)} partes.")
-            for part_index, text_segment in enumerate(parts):
-                if not text_segment.strip(): # Ignorar segmentos que son solo espacios/saltos de línea vacíos
-                    continue
+        if len(adopted_block_ids) < len(expected_children) and \
+           block_signature(child) == block_signature(expected_children[len(adopted_block_ids)]):
+            adopted_block_ids.append(child["id"])
+            continue
+        break
+    return adopted_block_ids
+
+async def insert_planned_children(parent_block_id: str, block_id: str, op_index: int, children: list,
+                                  after_block_id: str, context: RunContext, progress: dict = None,
+                                  created_block_ids: list = None):
+    """Ejecuta una operación insert_* registrando en el journal los IDs de cada lote creado.
+
+    Los IDs se van añadiendo a `created_block_ids` según se crean, así que si la inserción
+    falla a mitad la lista recoge los bloques que sí llegaron a crearse.
+    """
+    journal = context.journal
+    if created_block_ids is None: created_block_ids = []
+    created_block_ids.extend(progress["created"].get(op_index, []) if progress else [])
+    if created_block_ids: after_block_id = created_block_ids[-1]
+    remaining_children = children[len(created_block_ids):]
+    if progress is not None and remaining_children:
+        adopted_block_ids = await find_adoptable_children(
+            parent_block_id, after_block_id, remaining_children[:MAX_CHILDREN_PER_APPEND], context)
+        if adopted_block_ids:
+            if journal is not None: journal.record_created(block_id, op_index, adopted_block_ids)
+            created_block_ids.extend(adopted_block_ids)
+            after_block_id = adopted_block_ids[-1]
+            remaining_children = remaining_children[len(adopted_block_ids):]
+    if remaining_children:
+        def on_batch_created(batch_ids: list):
+            created_block_ids.extend(batch_ids)
+            if journal is not None: journal.record_created(block_id, op_index, batch_ids)
+        await append_children_after(parent_block_id, remaining_children, after_block_id, context,
+                                    on_batch_created=on_batch_created)
+    return created_block_ids
+
+def _is_not_found(error: Exception):
+    return isinstance(error, APIResponseError) and error.code == APIErrorCode.ObjectNotFound
+
+class BlockPlanError(Exception):
+    """Fallo a mitad de un plan. `last_placed_block_id` es el último bloque que quedó colocado
+    (el original o el último insertado tras él): el siguiente hermano debe anclarse ahí."""
+
+    def __init__(self, error: Exception, last_placed_block_id: str):
+        super().__init__(str(error) or type(error).__name__)
+        self.error = error
+        self.last_placed_block_id = last_placed_block_id
+
+async def apply_block_plan(parent_block_id: str, block_id: str, operations: list, anchor_block_id: str,
+                           context: RunContext, text_hash: str = None, progress: dict = None):
+    """Ejecuta las operaciones de plan_block_mutations y devuelve el ID del último bloque colocado.
 
-                # Es un bloque KaTeX $$...$$
-                if text_segment.startswith("$$") and text_segment.endswith("$$") and text_segment.count("$$") == 2:
-                    expression = text_segment[2:-2].strip()
-                    if expression:
-                        print(f"{indent}DEBUG (Rec):     Parte {part_index+1} es BLOQUE KaTeX: '{expression}'")
-                        new_blocks_payloads_for_this_original_block.append(create_equation_block_payload(expression))
-                        original_block_content_changed = True
-                    else:
-                        print(f"{indent}DEBUG (Rec):     Parte {part_index+1} es BLOQUE KaTeX VACÍO ($$$$). Se tratará como texto.")
-                        # Si es un $$ $$ vacío, lo tratamos como texto para que no se pierda si hay más
-                        # o lo procesamos como inline si tiene $ adentro (poco probable aquí).
-                        # Por ahora, si era un bloque $$ $$ vacío, se añade como texto.
-                        # Si el usuario quiere que párrafos vacíos o '$$$$' se eliminen, es otra lógica.
-                        # Intentar procesar el texto original '$$ $$' como inline
-                        inline_segments_for_empty_block = parse_text_for_inline_katex(text_segment)
-                        if inline_segments_for_empty_block:
-                            rt_list = []
-                            for st, sc in inline_segments_for_empty_block:
-                                if st == 'text' and sc: rt_list.append({"type": "text", "text": {"content": sc}})
-                                elif st == 'katex' and sc: rt_list.append({"type": "equation", "equation": {"expression": sc}})
-                            if rt_list: 
-                                payload = create_paragraph_block_payload_from_rich_text_list(rt_list)
-                                if payload: new_blocks_payloads_for_this_original_block.append(payload)
-                                original_block_content_changed = True # Marcamos cambio aunque sea sutil
-                        elif text_segment.strip(): # Si no hay inline pero hay algo
-                            payload = create_paragraph_block_payload_from_plain_text(text_segment)
-                            if payload: new_blocks_payloads_for_this_original_block.append(payload)
-                            original_block_content_changed = True
-
-
-                # Es un segmento de texto (antes, entre, o después de bloques $$...$$)
-                else: 
-                    print(f"{indent}DEBUG (Rec):     Parte {part_index+1} es TEXTO: '{text_segment[:100]}...' (puede tener $inline$)")
-                    inline_segments = parse_text_for_inline_katex(text_segment)
-                    if inline_segments:
-                        rich_text_list_for_paragraph = []
-                        for seg_type, content in inline_segments:
-                            if seg_type == 'text' and content:
-                                rich_text_list_for_paragraph.append({"type": "text", "text": {"content": content}})
-                            elif seg_type == 'katex' and content:
-                                rich_text_list_for_paragraph.append({"type": "equation", "equation": {"expression": content}})
-                        
-                        if rich_text_list_for_paragraph: # Solo añadir si hay contenido real
-                            payload = create_paragraph_block_payload_from_rich_text_list(rich_text_list_for_paragraph)
-                            if payload: new_blocks_payloads_for_this_original_block.append(payload)
-                            original_block_content_changed = True
-                    elif text_segment.strip(): # Si no hay inline, pero el texto tiene contenido
-                        payload = create_paragraph_block_payload_from_plain_text(text_segment)
-                        if payload: new_blocks_payloads_for_this_original_block.append(payload)
-                        original_block_content_changed = True # El simple hecho de separar ya es un cambio
-            
-            # Si el contenido original cambió (se dividió en partes o se procesó inline),
-            # reemplazar el bloque original con los nuevos bloques generados.
-            if original_block_content_changed and new_blocks_payloads_for_this_original_block:
-                print(f"{indent}DEBUG (Rec):   --> Reemplazando bloque {block_id} con {len(new_blocks_payloads_for_this_original_block)} nuevos bloques.")
+    Con `progress` (una entrada en vuelo del journal) se reanuda un plan interrumpido: las
+    operaciones terminadas se saltan y las inserciones continúan tras el último bloque creado.
+    Si una operación falla se lanza BlockPlanError con el último bloque que quedó colocado.
+    """
+    if context.dry_run:
+        context.record_planned_operations(parent_block_id, block_id, operations)
+        return block_id
+    journal = context.journal
+    # Bloques insertados tras el original; el último de ellos es el último bloque colocado.
+    inserted_after_ids = []
+    try:
+        if journal is not None and progress is None:
+            journal.record_plan(block_id, parent_block_id, anchor_block_id, operations, text_hash)
+        for op_index, operation in enumerate(operations):
+            if progress is not None and op_index in progress["done_ops"]:
+                if operation["op"] == "insert_after":
+                    inserted_after_ids.extend(progress["created"].get(op_index, []))
+                continue
+            if operation["op"] in ("insert_before", "insert_after"):
+                after_block_id = anchor_block_id if operation["op"] == "insert_before" else block_id
+                await insert_planned_children(
+                    parent_block_id, block_id, op_index, operation["children"], after_block_id, context, progress,
+                    created_block_ids=inserted_after_ids if operation["op"] == "insert_after" else None)
+            elif operation["op"] == "update":
+                updated_block = await context.scheduler.call(context.notion_client.blocks.update,
+                                                             block_id=operation["block_id"], **operation["data"])
+                record_block_state(updated_block, context)
+            elif operation["op"] == "delete":
                 try:
-                    temp_last_id_for_insertion = last_successfully_placed_block_id_at_this_level
-                    created_block_ids_for_this_op = []
-                    for payload_idx, payload_data in enumerate(new_blocks_payloads_for_this_original_block):
-                        response = notion_client.blocks.children.append(
-                            block_id=parent_block_id, children=[payload_data],
-                            after=temp_last_id_for_insertion if temp_last_id_for_insertion else None)
-                        new_b_id = response['results'][0]['id']
-                        print(f"{indent}DEBUG (Rec):     Nuevo bloque (parte {payload_idx+1}) creado (ID: {new_b_id}).")
-                        created_block_ids_for_this_op.append(new_b_id)
-                        temp_last_id_for_insertion = new_b_id
-                        time.sleep(0.35)
-                    
-                    notion_client.blocks.delete(block_id=block_id)
-                    print(f"{indent}DEBUG (Rec):     Bloque original {block_id} eliminado.")
-                    if created_block_ids_for_this_op:
-                        last_successfully_placed_block_id_at_this_level = created_block_ids_for_this_op[-1]
-                    block_was_replaced_or_deleted = True
-                    time.sleep(0.35)
+                    await context.scheduler.call(context.notion_client.blocks.delete, missing_ok=True,
+                                                 block_id=operation["block_id"])
                 except Exception as e:
-                    print(f"{indent}DEBUG (Rec):     ERROR reemplazando bloque {block_id} con nuevos segmentos: {e}")
-                    last_successfully_placed_block_id_at_this_level = block_id # Falló, el original sigue
-            else:
-                print(f"{indent}DEBUG (Rec):   No se detectaron cambios significativos o KaTeX procesable. Bloque se mantiene.")
-                last_successfully_placed_block_id_at_this_level = block_id
-        else: # El bloque no contenía $$...$$, podría ser solo inline o nada.
-            print(f"{indent}DEBUG (Rec):   No se encontraron bloques $$...$$ en el plain_text. Verificando solo inline $...$.")
-            # Esta es la lógica original para $inline$ cuando no hay $$...$$
-            if '$' in plain_text: # Ya sabemos que no es un "is_block_katex"
-                segments = parse_text_for_inline_katex(plain_text)
-                print(f"{indent}DEBUG (Rec):     Resultado de parse_text_for_inline_katex (solo inline): {segments}")
-                if segments:
-                    new_rich_text_payload_list = []
-                    has_meaningful_update = False
-                    for seg_type, content in segments:
-                        if seg_type == 'text':
-                            if content: new_rich_text_payload_list.append({"type": "text", "text": {"content": content}}); 
-                            if content.strip(): has_meaningful_update = True
-                        elif seg_type == 'katex':
-                            if content: new_rich_text_payload_list.append({"type": "equation", "equation": {"expression": content}}); has_meaningful_update = True
-                    
-                    if has_meaningful_update and new_rich_text_payload_list:
-                        print(f"{indent}DEBUG (Rec):   --> PROCESANDO solo como KaTeX inline. Nuevo rich_text: {new_rich_text_payload_list}")
-                        update_data = {block_type: {"rich_text": new_rich_text_payload_list}}
-                        type_specific_content_original = original_block.get(block_type, {})
-                        if block_type == "to_do" and "checked" in type_specific_content_original:
-                            update_data[block_type]["checked"] = type_specific_content_original["checked"]
-                        try:
-                            notion_client.blocks.update(block_id=block_id, **update_data)
-                            print(f"{indent}DEBUG (Rec):     Bloque {block_id} actualizado con KaTeX inline (sin $$).")
-                            time.sleep(0.35)
-                        except Exception as e:
-                            print(f"{indent}DEBUG (Rec):     ERROR actualizando bloque {block_id} para KaTeX inline (sin $$): {e}")
-                    else: print(f"{indent}DEBUG (Rec):     No se generó payload de rich_text para actualizar (solo inline).")
-                else: print(f"{indent}DEBUG (Rec):     No se encontraron segmentos KaTeX inline válidos (solo inline).")
-            else:
-                 print(f"{indent}DEBUG (Rec):   No contiene '$' para procesamiento inline.")
-            last_successfully_placed_block_id_at_this_level = block_id
-
-        # Recursión para bloques hijos si el bloque original NO fue reemplazado
-        if not block_was_replaced_or_deleted and has_children and block_type in RECURSIVE_CHILD_BEARING_TYPES:
-            print(f"{indent}DEBUG (Rec):   Bloque '{block_type}' ID {block_id} tiene hijos. Llamando recursivamente.")
-            process_blocks_recursively(block_id, notion_client, depth + 1)
-            
-    return last_successfully_placed_block_id_at_this_level
+                    # El borrado pudo aplicarse aunque su respuesta se perdiera (o antes de la
+                    # interrupción, al reanudar): un bloque ya inexistente cuenta como borrado.
+                    if not _is_not_found(e): raise
+                if context.state_store is not None: context.state_store.forget_block(operation["block_id"])
+            if journal is not None: journal.record_op_done(block_id, op_index)
+        if journal is not None: journal.record_block_done(block_id)
+    except Exception as e:
+        raise BlockPlanError(e, inserted_after_ids[-1] if inserted_after_ids else block_id) from e
+    return inserted_after_ids[-1] if inserted_after_ids else block_id
+
+async def recover_in_flight_block(entry: dict, context: RunContext):
+    """Completa (o deshace) una sustitución que quedó a medias en la ejecución anterior.
+
+    Se completa salvo que el bloque original haya desaparecido sin que lo borrase el plan, o
+    que su texto haya cambiado antes de aplicarse la actualización: en esos casos se eliminan
+    los bloques que el plan llegó a crear.
+    """
+    block_id = entry["block_id"]
+    operations = entry["operations"]
+    try:
+        current_block = await context.scheduler.call(context.notion_client.blocks.retrieve, block_id=block_id)
+    except Exception as e:
+        if not _is_not_found(e): raise
+        current_block = None
+    done_op_types = {operations[op_index]["op"] for op_index in entry["done_ops"]}
+    pending_op_types = {operation["op"] for op_index, operation in enumerate(operations)
+                        if op_index not in entry["done_ops"]}
+    # Si sólo queda el borrado del original, que falte significa que el borrado se aplicó y
+    # se perdió su respuesta: el plan terminó y no hay nada que deshacer.
+    original_missing = (current_block is None or current_block.get("archived")) and "delete" not in done_op_types \
+        and pending_op_types != {"delete"}
+    # El texto puede diferir del planificado porque nuestra propia actualización se aplicó
+    # sin llegar a registrarse: sólo es una edición ajena si tampoco coincide con el texto que
+    # esa actualización deja (calculado al planificar con el plain_text leído de la API).
+    expected_text_hashes = {entry.get("text_hash")} | {
+        hash_text(operation["expected_plain_text"]) for operation in operations if operation["op"] == "update"}
+    original_edited = current_block is not None and "update" not in done_op_types and entry.get("text_hash") \
+        and get_block_text_hash(current_block) not in expected_text_hashes
+    if not (original_missing or original_edited):
+        logger.info("Completando la sustitución interrumpida del bloque %s.", block_id)
+        await apply_block_plan(entry["parent_id"], block_id, operations, entry["anchor_id"], context, progress=entry)
+        return
+    logger.info("El bloque %s cambió durante la interrupción. Deshaciendo su sustitución.", block_id)
+    created_block_ids = [created_id for op_index in sorted(entry["created"]) for created_id in entry["created"][op_index]]
+    for op_index, operation in enumerate(operations):
+        if op_index in entry["done_ops"] or operation["op"] not in ("insert_before", "insert_after"): continue
+        after_block_id = (entry["created"].get(op_index) or [None])[-1] or \
+            (entry["anchor_id"] if operation["op"] == "insert_before" else block_id)
+        pending_children = operation["children"][len(entry["created"].get(op_index, [])):]
+        created_block_ids.extend(await find_adoptable_children(
+            entry["parent_id"], after_block_id, pending_children[:MAX_CHILDREN_PER_APPEND], context))
+    for created_block_id in created_block_ids:
+        try:
+            await context.scheduler.call(context.notion_client.blocks.delete, block_id=created_block_id)
+        except Exception as e:
+            if not _is_not_found(e): raise
+    context.journal.record_block_done(block_id)
+
+# ------------------------------------------------------------------------------------
+
+async def plan_blocks(blocks, context: RunContext):
+    """Etapa de planificación: devuelve (bloque, operaciones) para cada bloque recibido."""
+    block_index = 0
+    async for original_block in blocks:
+        block_type = original_block.get("type")
+        logger.debug("Revisando bloque %d: %s (tipo %s, hijos: %s)", block_index + 1, original_block["id"],
+                     block_type, original_block.get("has_children", False))
+        operations = []
+        context.blocks_scanned += 1
+        if block_type == "table":
+            pass
+        elif context.journal is not None and context.journal.is_block_done(original_block["id"]):
+            logger.debug("Bloque ya procesado en la ejecución anterior. Omitiendo.")
+        elif block_type not in TEXT_BEARING_BLOCK_TYPES:
+            logger.debug("Bloque de tipo '%s' no es text-bearing. Omitiendo.", block_type)
+        elif is_block_unchanged_since_last_run(original_block, context):
+            # El texto no ha cambiado desde la última ejecución: no hace falta analizarlo,
+            # pero sus hijos sí pueden haber cambiado y se siguen recorriendo.
+            logger.debug("Bloque sin cambios desde la última ejecución. Omitiendo análisis.")
+        else:
+            # Todo bloque salvo el primero tiene un hermano anterior ya colocado que sirve de ancla.
+            parse_started = time.perf_counter()
+            operations = plan_block_mutations(original_block, has_previous_sibling=block_index > 0)
+            context.metrics.parse_seconds += time.perf_counter() - parse_started
+            if not operations: record_block_state(original_block, context)
+        block_index += 1
+        yield original_block, operations
+
+def should_process_children(block_data: dict):
+    if block_data.get("type") not in RECURSIVE_CHILD_BEARING_TYPES: return False
+    # Los hijos de una copia de un synced_block son los del original: se procesan sólo allí
+    # para no escribir dos veces (y en paralelo) sobre los mismos bloques.
+    if block_data.get("type") == "synced_block" and block_data.get("synced_block", {}).get("synced_from"): return False
+    return True
+
+async def process_blocks_recursively(parent_block_id: str, context: RunContext, depth=0):
+    # Las escrituras sobre los hijos de parent_block_id se hacen en orden (encadenando after=),
+    # mientras que los subárboles (hijos de toggles, listas y tablas) se lanzan como tareas
+    # concurrentes que sólo escriben dentro de su propio padre.
+    # Devuelve True si el nivel y todos sus subárboles terminaron sin errores.
+    logger.debug("Procesando hijos de %s (nivel %d)", parent_block_id, depth)
+    if context.journal is not None and parent_block_id in context.journal.done_subtrees:
+        logger.debug("Subárbol %s ya completado en la ejecución anterior. Omitiendo.", parent_block_id)
+        return True
+
+    last_successfully_placed_block_id_at_this_level = None
+    subtrees = SubtreeGroup(context)
+    level_succeeded = True
+    stage_tasks = []
+    block_count = 0
+    try:
+        async with context.subtree_slots:
+            blocks = start_stage(iter_children(parent_block_id, context), stage_tasks)
+            planned_blocks = start_stage(plan_blocks(blocks, context), stage_tasks)
+            # Etapa de escritura.
+            async for original_block, operations in planned_blocks:
+                block_count += 1
+                block_id = original_block["id"]
+                block_type = original_block.get("type")
+                has_children = original_block.get("has_children", False)
+
+                if block_type == "table":
+                    await subtrees.wait_for_capacity(MAX_PENDING_SUBTREES)
+                    subtrees.spawn(process_simple_table_rows(block_id, depth + 1, context))
+                    last_successfully_placed_block_id_at_this_level = block_id
+                    continue
+
+                block_was_deleted = False
+                if operations:
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Aplicando %d operaciones al bloque %s: %s", len(operations), block_id,
+                                     [operation["op"] for operation in operations])
+                    try:
+                        last_successfully_placed_block_id_at_this_level = await apply_block_plan(
+                            parent_block_id, block_id, operations, last_successfully_placed_block_id_at_this_level,
+                            context, text_hash=get_block_text_hash(original_block))
+                        block_was_deleted = any(operation["op"] == "delete" for operation in operations)
+                        context.blocks_modified += 1
+                    except BlockPlanError as e:
+                        logger.error("Error aplicando operaciones al bloque %s: %s", block_id, e, extra={"block_id": block_id})
+                        context.error_count += 1
+                        level_succeeded = False
+                        # El original sigue en su sitio, quizá seguido de parte de sus bloques nuevos.
+                        last_successfully_placed_block_id_at_this_level = e.last_placed_block_id
+                else:
+                    last_successfully_placed_block_id_at_this_level = block_id
+
+                # El bloque original se conserva salvo que se haya eliminado, así que sus hijos se procesan.
+                if not block_was_deleted and has_children and should_process_children(original_block):
+                    await subtrees.wait_for_capacity(MAX_PENDING_SUBTREES)
+                    subtrees.spawn(process_blocks_recursively(block_id, context, depth + 1))
+    except Exception as e:
+        logger.error("Error obteniendo los hijos de %s: %s", parent_block_id, e, extra={"block_id": parent_block_id})
+        context.error_count += 1
+        level_succeeded = False
+    finally:
+        for task in stage_tasks: task.cancel()
+
+    logger.debug("Procesados %d bloques hijos de %s.", block_count, parent_block_id)
+    # El hueco de este nivel ya se ha liberado: los subárboles pendientes pueden avanzar.
+    if not await subtrees.wait(): level_succeeded = False
+    if level_succeeded and context.journal is not None:
+        context.journal.record_subtree_done(parent_block_id)
+    return level_succeeded
+
+async def process_page(page_id: str, notion_api_key: str, scheduler: NotionRequestScheduler = None,
+                       state_store: BlockStateStore = None, dry_run: bool = False,
+                       notion_base_url: str = NOTION_BASE_URL, journal_dir: str = JOURNAL_DIR,
+                       resume: bool = False, notion_client: AsyncClient = None):
+    """Procesa una página y devuelve el RunContext de la ejecución.
+
+    Usa `notion_client` si se indica (sin cerrarlo) o, si no, un cliente propio. Salvo en
+    dry-run, cada escritura se registra en el journal de la página (`journal_dir`); con
+    `resume` se continúa la ejecución anterior a partir de ese journal.
+    """
+    if scheduler is None:
+        scheduler = create_scheduler()
+    # El journal se abre antes que el cliente: si lanza UnfinishedJournalError no queda ningún
+    # cliente propio sin cerrar.
+    journal = None if dry_run or not journal_dir else RunJournal.for_page(journal_dir, page_id, resume=resume)
+    owns_client = notion_client is None
+    if owns_client:
+        notion_client = AsyncClient(auth=notion_api_key, base_url=notion_base_url)
+    context = RunContext(notion_client, scheduler, state_store, journal=journal, dry_run=dry_run)
+    try:
+        await process_page_with_client(page_id, context)
+        return context
+    finally:
+        scheduler.metrics.record_page(context.blocks_scanned, context.blocks_modified)
+        if owns_client: await notion_client.aclose()
+        if journal is not None: journal.close()
+
+def create_scheduler():
+    return NotionRequestScheduler(
+        requests_per_second=NOTION_REQUESTS_PER_SECOND, burst_size=NOTION_BURST_SIZE,
+        max_concurrent_requests=MAX_CONCURRENT_REQUESTS)
+
+async def process_pages(notion_api_key: str, page_ids=(), database_ids=(), search_queries=(),
+                        workers: int = BATCH_WORKERS, scheduler: NotionRequestScheduler = None,
+                        state_store: BlockStateStore = None, dry_run: bool = False,
+                        notion_base_url: str = NOTION_BASE_URL, journal_dir: str = JOURNAL_DIR,
+                        resume: bool = False):
+    """Modo por lotes: procesa páginas sueltas, filas de bases de datos y resultados de búsqueda.
+
+    Todas las páginas comparten un cliente y un planificador, así que el presupuesto de
+    peticiones es global por muchos workers que haya. Devuelve el BatchProgress con el
+    resultado de cada página.
+    """
+    if scheduler is None:
+        scheduler = create_scheduler()
+    notion_client = AsyncClient(auth=notion_api_key, base_url=notion_base_url)
+    try:
+        all_page_ids = await collect_page_ids(notion_client, scheduler, page_ids, database_ids, search_queries)
+        logger.info("Modo por lotes: %d páginas con %d workers.", len(all_page_ids), workers)
+        progress = BatchProgress(len(all_page_ids))
+
+        async def process_one(page_id: str):
+            return await process_page(page_id, notion_api_key, scheduler=scheduler, state_store=state_store,
+                                      dry_run=dry_run, journal_dir=journal_dir, resume=resume,
+                                      notion_client=notion_client)
+
+        await run_worker_pool(all_page_ids, process_one, workers, progress)
+        logger.info(progress.summary())
+        return progress
+    finally:
+        await notion_client.aclose()
+
+async def process_page_with_client(page_id: str, context: RunContext):
+    """Procesa una página completa; en modo incremental la omite si no ha cambiado."""
+    if context.journal is not None:
+        if context.journal.run_done:
+            logger.info("La ejecución anterior sobre %s ya terminó. Nada que reanudar.", page_id)
+            return
+        for entry in list(context.journal.in_flight_blocks.values()):
+            try:
+                await recover_in_flight_block(entry, context)
+            except Exception as e:
+                logger.error("Error recuperando el bloque %s: %s", entry["block_id"], e, extra={"block_id": entry["block_id"]})
+                context.error_count += 1
+    if context.state_store is not None:
+        page = await context.scheduler.call(context.notion_client.blocks.retrieve, block_id=page_id)
+        if context.state_store.is_page_unchanged(page_id, page["last_edited_time"]):
+            logger.info("La página %s no ha cambiado desde la última ejecución. Omitiendo.", page_id)
+            return
+    try:
+        if await process_blocks_recursively(page_id, context, depth=0) and context.journal is not None:
+            context.journal.record_run_done()
+        if context.state_store is not None and context.error_count == 0 and not context.dry_run:
+            # Se lee de nuevo tras las escrituras propias, que también cambian last_edited_time.
+            page = await context.scheduler.call(context.notion_client.blocks.retrieve, block_id=page_id)
+            context.state_store.record_page(page_id, page["last_edited_time"])
+    finally:
+        if context.state_store is not None: context.state_store.commit()
+
+def write_plan(planned_operations: dict, plan_output: str):
+    plan_json = json.dumps(planned_operations, indent=2, ensure_ascii=False)
+    if plan_output == "-":
+        print(plan_json)
+    else:
+        with open(plan_output, "w", encoding="utf-8") as plan_file:
+            plan_file.write(plan_json + "\n")
+        print(f"Plan con {len(planned_operations)} bloques guardado en {plan_output}")
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Convierte el LaTeX de una página de Notion en ecuaciones KaTeX.")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="calcula el plan de cambios sin escribir nada en Notion")
+    parser.add_argument("--plan-output", default="-",
+                        help="fichero JSON donde guardar el plan del dry-run ('-' = salida estándar)")
+    parser.add_argument("--resume", action="store_true",
+                        help="reanuda una ejecución interrumpida a partir de su journal en JOURNAL_DIR")
+    parser.add_argument("--yes", "-y", action="store_true", help="no pide confirmación antes de escribir")
+    parser.add_argument("--log-level", default=LOG_LEVEL, choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        type=str.upper, help=f"nivel de los logs en stderr (por defecto {LOG_LEVEL})")
+    parser.add_argument("--log-format", default=LOG_FORMAT, choices=["text", "json"],
+                        help="formato de los logs: texto o una línea JSON por evento")
+    parser.add_argument("--metrics-output", default=METRICS_OUTPUT,
+                        help="fichero donde exportar las métricas al terminar ('-' = salida estándar)")
+    parser.add_argument("--metrics-format", default=METRICS_FORMAT, choices=["json", "prometheus"],
+                        help="formato de las métricas exportadas")
+    batch_group = parser.add_argument_group(
+        "modo por lotes", "procesa varias páginas en paralelo sin pedir confirmación (ignora PAGE_ID_TO_PROCESS)")
+    batch_group.add_argument("--pages", nargs="+", default=[], metavar="PAGE_ID", help="IDs o URLs de páginas")
+    batch_group.add_argument("--pages-file", help="fichero con un ID o URL de página por línea")
+    batch_group.add_argument("--database", action="append", default=[], metavar="DATABASE_ID",
+                             help="procesa todas las páginas de la base de datos (repetible)")
+    batch_group.add_argument("--search", action="append", default=[], metavar="QUERY",
+                             help="procesa las páginas cuyo título coincide con la búsqueda (repetible)")
+    batch_group.add_argument("--workers", type=int, default=BATCH_WORKERS,
+                             help=f"páginas procesadas a la vez (por defecto {BATCH_WORKERS})")
+    return parser.parse_args(argv)
+
+def is_batch_mode(args):
+    return bool(args.pages or args.pages_file or args.database or args.search)
+
+def run_from_arguments(args, state_store: BlockStateStore = None, dry_run: bool = False):
+    """Ejecuta el modo por lotes o el de página única.
+
+    Devuelve las operaciones planificadas, si hubo fallos y las métricas de la ejecución.
+    """
+    scheduler = create_scheduler()
+    try:
+        if not is_batch_mode(args):
+            context = asyncio.run(process_page(PAGE_ID_TO_PROCESS, NOTION_API_KEY, scheduler=scheduler,
+                                               state_store=state_store, dry_run=dry_run, resume=args.resume))
+            return context.planned_operations, context.error_count > 0, scheduler.metrics
+        page_ids = list(args.pages) + (read_page_ids_file(args.pages_file) if args.pages_file else [])
+        progress = asyncio.run(process_pages(NOTION_API_KEY, page_ids, args.database, args.search,
+                                             workers=args.workers, scheduler=scheduler, state_store=state_store,
+                                             dry_run=dry_run, resume=args.resume))
+        planned_operations = {}
+        for result in progress.results:
+            if result.context is not None: planned_operations.update(result.context.planned_operations)
+        return planned_operations, bool(progress.failed_pages), scheduler.metrics
+    finally:
+        scheduler.metrics.finish()
+        logger.info("Métricas: %s", scheduler.metrics.summary())
+        if args.metrics_output:
+            scheduler.metrics.write(args.metrics_output, args.metrics_format)
 
 # --- Bloque Principal de Ejecución ---
 if __name__ == "__main__":
+    args = parse_arguments()
+    configure_logging(args.log_level, args.log_format)
     if NOTION_API_KEY == "tu_integration_secret_aqui" or \
-       PAGE_ID_TO_PROCESS == "el_id_de_tu_pagina_de_notion_aqui":
+       (PAGE_ID_TO_PROCESS == "el_id_de_tu_pagina_de_notion_aqui" and not is_batch_mode(args)):
         print("ERROR SCRIPT: Por favor, establece tus variables NOTION_API_KEY y PAGE_ID_TO_PROCESS.")
+    elif args.dry_run:
+        # Los logs van a stderr, así que el plan en JSON puede redirigirse limpio.
+        planned_operations, _, _ = run_from_arguments(args, dry_run=True)
+        write_plan(planned_operations, args.plan_output)
     else:
-        print("ADVERTENCIA: Este script realizará cambios en tu página de Notion.")
-        confirm = input("¿Estás seguro de que quieres continuar y procesar la página (s/n)?: ")
+        confirm = "s"
+        if not is_batch_mode(args) and not args.yes:
+            print("ADVERTENCIA: Este script realizará cambios en tu página de Notion.")
+            confirm = input("¿Estás seguro de que quieres continuar y procesar la página (s/n)?: ")
         if confirm.lower() == 's':
+            had_failures = True
             try:
-                client = Client(auth=NOTION_API_KEY)
-                process_blocks_recursively(PAGE_ID_TO_PROCESS, client, depth=0)
-                print("\nProcesamiento COMPLETADO.")
+                state_store = BlockStateStore(STATE_DB_PATH) if STATE_DB_PATH else None
+                try:
+                    _, had_failures, _ = run_from_arguments(args, state_store=state_store)
+                finally:
+                    if state_store is not None: state_store.close()
+                print("\nProcesamiento COMPLETADO." if not had_failures else
+                      "\nProcesamiento COMPLETADO CON ERRORES. Ejecuta de nuevo con --resume para reintentar.")
+            except KeyboardInterrupt:
+                print("\nProcesamiento INTERRUMPIDO. Ejecuta de nuevo con --resume para continuar.")
             except Exception as e:
                 print(f"ERROR FATAL durante la inicialización o ejecución: {e}")
+                print("Ejecuta de nuevo con --resume para continuar donde se quedó.")
+            # Código de salida distinto de cero para que cron/CI detecten las páginas con errores.
+            if had_failures: sys.exit(1)
         else:
-            print("Procesamiento cancelado.")
\ No newline at end of file
+            print("Procesamiento cancelado.")
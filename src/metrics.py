@@ -0,0 +1,182 @@
+import json
+import re
+import time
+from collections import Counter
+
+# Límites (en segundos) de los buckets del histograma de latencias, al estilo de Prometheus.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def endpoint_name(endpoint) -> str:
+    """Nombre legible de un endpoint de notion_client: `blocks.children.list`, `search`..."""
+    owner = getattr(endpoint, "__self__", endpoint)
+    words = re.findall(r"[A-Z][a-z]*", type(owner).__name__.replace("Endpoint", ""))
+    if not words:
+        return getattr(endpoint, "__name__", type(endpoint).__name__)
+    name = ".".join(word.lower() for word in words)
+    return f"{name}.{endpoint.__name__}" if owner is not endpoint else name
+
+
+def error_label(error: Exception) -> str:
+    """Etiqueta corta de un fallo de llamada: el código HTTP si lo hay o el tipo de la excepción."""
+    status = getattr(error, "status", None)
+    return str(status) if status is not None else type(error).__name__
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)  # el último es +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        index = 0
+        while index < len(self.buckets) and seconds > self.buckets[index]:
+            index += 1
+        self.bucket_counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max: self.max = seconds
+
+    def cumulative_counts(self):
+        """Pares (límite, observaciones <= límite) con el último límite "+Inf"."""
+        total = 0
+        for bound, bucket_count in zip(list(self.buckets) + ["+Inf"], self.bucket_counts):
+            total += bucket_count
+            yield bound, total
+
+    def to_dict(self):
+        return {"count": self.count, "sum": round(self.sum, 6),
+                "mean": round(self.sum / self.count, 6) if self.count else 0.0, "max": round(self.max, 6),
+                "buckets": {str(bound): total for bound, total in self.cumulative_counts()}}
+
+
+class RunMetrics:
+    """Métricas de una ejecución (una página o un lote entero).
+
+    Las actualiza el planificador de peticiones (llamadas, latencias, esperas y reintentos)
+    y el recorrido de bloques (bloques revisados/modificados y tiempo de análisis del texto).
+    Todas las operaciones son sumas en memoria: mantenerlas siempre activas no cuesta nada
+    apreciable frente a una llamada HTTP.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.finished_at = None
+        self.api_calls = Counter()
+        self.api_errors = Counter()
+        self.retries = Counter()
+        self.latency = {}
+        # Tiempo esperando al token bucket, a un hueco de concurrencia y en backoff entre reintentos.
+        self.throttle_wait_seconds = 0.0
+        self.concurrency_wait_seconds = 0.0
+        self.backoff_seconds = 0.0
+        self.pages = 0
+        self.blocks_scanned = 0
+        self.blocks_modified = 0
+        self.parse_seconds = 0.0
+
+    def observe_api_call(self, endpoint: str, seconds: float, error: Exception = None):
+        self.api_calls[endpoint] += 1
+        histogram = self.latency.get(endpoint)
+        if histogram is None:
+            histogram = self.latency[endpoint] = LatencyHistogram()
+        histogram.observe(seconds)
+        if error is not None:
+            self.api_errors[(endpoint, error_label(error))] += 1
+
+    def observe_retry(self, endpoint: str, delay: float):
+        self.retries[endpoint] += 1
+        self.backoff_seconds += delay
+
+    def record_page(self, blocks_scanned: int, blocks_modified: int):
+        self.pages += 1
+        self.blocks_scanned += blocks_scanned
+        self.blocks_modified += blocks_modified
+
+    def finish(self):
+        self.finished_at = time.perf_counter()
+
+    @property
+    def elapsed_seconds(self):
+        return (self.finished_at or time.perf_counter()) - self.started_at
+
+    def _per_second(self, value: float):
+        elapsed = self.elapsed_seconds
+        return value / elapsed if elapsed else 0.0
+
+    def summary(self):
+        return (f"{sum(self.api_calls.values())} llamadas a la API, {self.blocks_scanned} bloques revisados "
+                f"({self._per_second(self.blocks_scanned):.1f}/s), {self.blocks_modified} modificados, "
+                f"{self.throttle_wait_seconds:.1f} s esperando al límite de ritmo, "
+                f"{self.backoff_seconds:.1f} s en backoff, {self.parse_seconds:.3f} s analizando texto")
+
+    def to_dict(self):
+        return {
+            "elapsed_seconds": round(self.elapsed_seconds, 3),
+            "pages": self.pages,
+            "blocks_scanned": self.blocks_scanned,
+            "blocks_modified": self.blocks_modified,
+            "blocks_scanned_per_second": round(self._per_second(self.blocks_scanned), 2),
+            "blocks_modified_per_second": round(self._per_second(self.blocks_modified), 2),
+            "parse_seconds": round(self.parse_seconds, 6),
+            "throttle_wait_seconds": round(self.throttle_wait_seconds, 3),
+            "concurrency_wait_seconds": round(self.concurrency_wait_seconds, 3),
+            "backoff_seconds": round(self.backoff_seconds, 3),
+            "api_calls": dict(self.api_calls),
+            "api_errors": {f"{endpoint} {label}": count for (endpoint, label), count in self.api_errors.items()},
+            "retries": dict(self.retries),
+            "latency_seconds": {endpoint: histogram.to_dict() for endpoint, histogram in self.latency.items()},
+        }
+
+    def to_prometheus(self):
+        """Texto en formato de exposición de Prometheus (p. ej. para el textfile collector)."""
+        lines = []
+
+        def metric(name, metric_type, help_text, samples):
+            lines.append(f"# HELP notion_katex_{name} {help_text}")
+            lines.append(f"# TYPE notion_katex_{name} {metric_type}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{label_value}"' for key, label_value in labels.items())
+                lines.append(f"notion_katex_{name}{{{label_text}}} {value}" if label_text else f"notion_katex_{name} {value}")
+
+        metric("api_calls_total", "counter", "Llamadas a la API de Notion (incluidos reintentos).",
+               [({"endpoint": endpoint}, count) for endpoint, count in sorted(self.api_calls.items())])
+        metric("api_errors_total", "counter", "Llamadas fallidas por endpoint y código.",
+               [({"endpoint": endpoint, "code": label}, count)
+                for (endpoint, label), count in sorted(self.api_errors.items())])
+        metric("api_retries_total", "counter", "Reintentos por endpoint.",
+               [({"endpoint": endpoint}, count) for endpoint, count in sorted(self.retries.items())])
+        lines.append("# HELP notion_katex_api_latency_seconds Latencia de las llamadas a la API.")
+        lines.append("# TYPE notion_katex_api_latency_seconds histogram")
+        for endpoint, histogram in sorted(self.latency.items()):
+            for bound, total in histogram.cumulative_counts():
+                lines.append(f'notion_katex_api_latency_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {total}')
+            lines.append(f'notion_katex_api_latency_seconds_sum{{endpoint="{endpoint}"}} {histogram.sum:.6f}')
+            lines.append(f'notion_katex_api_latency_seconds_count{{endpoint="{endpoint}"}} {histogram.count}')
+        metric("throttle_wait_seconds_total", "counter", "Tiempo esperando al token bucket.",
+               [({}, f"{self.throttle_wait_seconds:.6f}")])
+        metric("concurrency_wait_seconds_total", "counter", "Tiempo esperando un hueco de concurrencia.",
+               [({}, f"{self.concurrency_wait_seconds:.6f}")])
+        metric("backoff_seconds_total", "counter", "Tiempo en backoff antes de reintentar (incluye Retry-After).",
+               [({}, f"{self.backoff_seconds:.6f}")])
+        metric("pages_total", "counter", "Páginas procesadas.", [({}, self.pages)])
+        metric("blocks_scanned_total", "counter", "Bloques revisados.", [({}, self.blocks_scanned)])
+        metric("blocks_modified_total", "counter", "Bloques modificados (o planificados en dry-run).",
+               [({}, self.blocks_modified)])
+        metric("parse_seconds_total", "counter", "Tiempo analizando texto en busca de KaTeX.",
+               [({}, f"{self.parse_seconds:.6f}")])
+        metric("run_seconds", "gauge", "Duración de la ejecución.", [({}, f"{self.elapsed_seconds:.3f}")])
+        metric("blocks_scanned_per_second", "gauge", "Bloques revisados por segundo.",
+               [({}, f"{self._per_second(self.blocks_scanned):.3f}")])
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str, metrics_format: str = "json"):
+        content = self.to_prometheus() if metrics_format == "prometheus" else json.dumps(self.to_dict(), indent=2) + "\n"
+        if path == "-":
+            print(content, end="")
+            return
+        with open(path, "w", encoding="utf-8") as metrics_file:
+            metrics_file.write(content)
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import random
+import time
+
+import httpx
+from notion_client.errors import APIErrorCode, APIResponseError, HTTPResponseError, RequestTimeoutError
+
+from metrics import RunMetrics, endpoint_name, error_label
+
+logger = logging.getLogger("notion_katex.scheduler")
+
+# Códigos HTTP que indican un fallo transitorio del lado de Notion.
+RETRYABLE_STATUS_CODES = {500, 502, 503, 504}
+# 409 (conflict_error) significa que la transacción no se aplicó: reintentar es seguro.
+NOT_APPLIED_STATUS_CODES = {409, 429}
+
+
+class TokenBucket:
+    """Token bucket asíncrono: `rate` peticiones/segundo de media con ráfagas de hasta `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self):
+        """Espera un token y devuelve los segundos que hubo que esperar."""
+        started = time.monotonic()
+        # El lock hace que los que esperan se atiendan en orden de llegada.
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if self._paused_until > now:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return now - started
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Detiene el bucket para todos los llamadores (p. ej. tras un 429 con Retry-After)."""
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + seconds)
+        self._tokens = 0
+        self._updated_at = max(self._updated_at, self._paused_until)
+
+
+class NotionRequestScheduler:
+    """Punto único por el que pasan todas las llamadas a la API de Notion.
+
+    Combina un token bucket (ritmo medio y ráfagas), un límite de peticiones en vuelo
+    y reintentos: los 429 respetan `Retry-After` pausando a todos los llamadores, y los
+    5xx / timeouts se reintentan con backoff exponencial y jitter. Cada llamada, espera y
+    reintento se anota en `metrics`.
+    """
+
+    def __init__(self, requests_per_second: float = 3.0, burst_size: int = 10,
+                 max_concurrent_requests: int = 3, max_retries: int = 5,
+                 base_backoff: float = 0.5, max_backoff: float = 30.0, metrics: RunMetrics = None):
+        self._bucket = TokenBucket(requests_per_second, burst_size)
+        self._in_flight = asyncio.Semaphore(max_concurrent_requests)
+        self.metrics = metrics if metrics is not None else RunMetrics()
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+    async def call(self, endpoint, *, idempotent: bool = True, missing_ok: bool = False, **kwargs):
+        """Ejecuta `endpoint(**kwargs)` con control de ritmo y reintentos.
+
+        Las llamadas no idempotentes (p. ej. `children.append`) sólo se reintentan cuando
+        Notion garantiza que la petición no se aplicó (429, 409 o error de conexión). Con
+        `missing_ok` (p. ej. `blocks.delete`), un object_not_found en un reintento significa
+        que un intento anterior se aplicó aunque su respuesta se perdiera: devuelve None.
+        """
+        name = endpoint_name(endpoint)
+        attempt = 0
+        while True:
+            self.metrics.throttle_wait_seconds += await self._bucket.acquire()
+            waiting_since = time.perf_counter()
+            async with self._in_flight:
+                started = time.perf_counter()
+                self.metrics.concurrency_wait_seconds += started - waiting_since
+                try:
+                    result = await endpoint(**kwargs)
+                except Exception as error:
+                    self.metrics.observe_api_call(name, time.perf_counter() - started, error)
+                    if missing_ok and attempt > 0 and isinstance(error, APIResponseError) \
+                       and error.code == APIErrorCode.ObjectNotFound:
+                        return None
+                    failure = error
+                else:
+                    self.metrics.observe_api_call(name, time.perf_counter() - started)
+                    return result
+            delay = self._retry_delay(failure, attempt, idempotent)
+            if delay is None or attempt >= self.max_retries:
+                raise failure
+            logger.debug("%s falló (%s); reintento %d en %.2f s", name, error_label(failure), attempt + 1, delay)
+            self.metrics.observe_retry(name, delay)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def _backoff(self, attempt: int) -> float:
+        # "Full jitter": espera aleatoria entre 0 y el backoff exponencial.
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * (2 ** attempt)))
+
+    def _retry_delay(self, error: Exception, attempt: int, idempotent: bool):
+        """Devuelve los segundos a esperar antes de reintentar, o None si no se debe reintentar."""
+        if isinstance(error, HTTPResponseError):
+            if error.status == 429:
+                retry_after = parse_retry_after(error.headers.get("retry-after"))
+                delay = retry_after if retry_after is not None else self._backoff(attempt)
+                self._bucket.pause(delay)
+                return delay
+            if error.status in NOT_APPLIED_STATUS_CODES:
+                return self._backoff(attempt)
+            if error.status in RETRYABLE_STATUS_CODES and idempotent:
+                return self._backoff(attempt)
+            return None
+        if isinstance(error, httpx.ConnectError):
+            return self._backoff(attempt)
+        if isinstance(error, (RequestTimeoutError, httpx.TransportError)) and idempotent:
+            return self._backoff(attempt)
+        return None
+
+
+def parse_retry_after(value):
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
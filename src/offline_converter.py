@@ -0,0 +1,303 @@
+"""Conversor offline de exportaciones de bloques de Notion (formato de `children.list`).
+
+Reescribe en disco árboles de bloques exportados aplicando las mismas conversiones que
+main.py hace contra la API: planifica cada bloque con `plan_block_mutations` y cada fila de
+tabla con `plan_table_row_update`, y aplica las operaciones a las listas de hermanos en
+memoria. No hace ninguna llamada a Notion.
+
+Cada fichero de entrada es un objeto `{"object": "list", "results": [...], ...}`; los hijos
+anidados van en la clave `children` de cada bloque (como en los fixtures del servidor local).
+El array `results` se lee y se escribe bloque a bloque con `json.JSONDecoder.raw_decode`, así
+que la memoria no depende del tamaño del fichero sino del mayor bloque de primer nivel. Los
+ficheros se reparten entre los procesos de un `ProcessPoolExecutor`, y por cada uno se
+escribe, junto a la salida, un informe `<salida>.report.json` con los cambios.
+
+Uso:
+    python src/offline_converter.py exportaciones/ --output-dir convertidas/ --workers 8
+    python src/offline_converter.py pagina.json otra.json --output-dir convertidas/
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from main import (TEXT_BEARING_BLOCK_TYPES, plan_block_mutations, plan_table_row_update, should_process_children,
+                  table_row_contains_dollar)
+
+READ_CHUNK_SIZE = 1 << 20
+REPORT_SUFFIX = ".report.json"
+_WHITESPACE = " \t\n\r"
+
+
+class StreamingJsonReader:
+    """Lector incremental de un documento JSON: decodifica valores a medida que llegan del fichero.
+
+    Mantiene en memoria sólo el trozo aún no consumido. Cuando un valor queda cortado al final
+    del búfer (o podría continuar, como un número), se leen más datos y se vuelve a intentar.
+    """
+
+    def __init__(self, input_file, chunk_size: int = READ_CHUNK_SIZE):
+        self._file = input_file
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._position = 0
+        self._eof = False
+
+    def _read_more(self):
+        # El tamaño de lectura crece con lo pendiente para que un valor enorme no sea cuadrático.
+        chunk = self._file.read(max(self._chunk_size, len(self._buffer) - self._position))
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._position:] + chunk
+        self._position = 0
+        return True
+
+    def peek(self) -> str:
+        """Devuelve el siguiente carácter no blanco sin consumirlo ("" al final del fichero)."""
+        while True:
+            while self._position < len(self._buffer) and self._buffer[self._position] in _WHITESPACE:
+                self._position += 1
+            if self._position < len(self._buffer): return self._buffer[self._position]
+            if not self._read_more(): return ""
+
+    def expect(self, character: str):
+        if self.peek() != character:
+            raise ValueError(f"JSON inesperado: se esperaba {character!r} y se encontró {self.peek()!r}")
+        self._position += 1
+
+    def decode_value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._position)
+            except json.JSONDecodeError:
+                if not self._eof and self._read_more(): continue
+                raise
+            if end == len(self._buffer) and not self._eof and self._read_more():
+                continue  # p. ej. un número que puede seguir en el siguiente trozo
+            self._position = end
+            return value
+
+
+def _iter_results_array(reader: StreamingJsonReader):
+    reader.expect("[")
+    if reader.peek() == "]":
+        reader.expect("]"); return
+    while True:
+        yield reader.decode_value()
+        if reader.peek() != ",": break
+        reader.expect(",")
+    reader.expect("]")
+
+
+def iter_list_export(reader: StreamingJsonReader):
+    """Recorre el objeto de nivel superior emitiendo ("key", clave, valor) y ("result", bloque).
+
+    Los bloques de `results` se emiten de uno en uno, sin cargar el array entero. También se
+    acepta un array de bloques suelto en lugar del objeto (sin eventos "key").
+    """
+    if reader.peek() == "[":
+        yield "results_start", None, None
+        for block in _iter_results_array(reader):
+            yield "result", None, block
+        yield "results_end", None, None
+        return
+    reader.expect("{")
+    if reader.peek() == "}":
+        reader.expect("}"); return
+    while True:
+        key = reader.decode_value()
+        reader.expect(":")
+        if key == "results":
+            yield "results_start", key, None
+            for block in _iter_results_array(reader):
+                yield "result", key, block
+            yield "results_end", key, None
+        else:
+            yield "key", key, reader.decode_value()
+        if reader.peek() == ",":
+            reader.expect(","); continue
+        reader.expect("}"); return
+
+
+def _export_block(payload: dict, original_block_id: str, index: int):
+    block = dict(payload)
+    # ID determinista derivado del bloque original: repetir la conversión da la misma salida.
+    block["id"] = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{original_block_id}/{index}"))
+    block["has_children"] = False
+    return block
+
+
+class ChangeReport:
+    def __init__(self, input_path: str, output_path: str):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.blocks_scanned = 0
+        self.blocks_modified = 0
+        self.blocks_inserted = 0
+        self.blocks_deleted = 0
+        self.table_rows_modified = 0
+        self.changes = []
+
+    def to_dict(self, seconds: float):
+        return {"input": self.input_path, "output": self.output_path, "seconds": round(seconds, 3),
+                "blocks_scanned": self.blocks_scanned, "blocks_modified": self.blocks_modified,
+                "blocks_inserted": self.blocks_inserted, "blocks_deleted": self.blocks_deleted,
+                "table_rows_modified": self.table_rows_modified, "changes": self.changes}
+
+
+def _apply_row_update(row_block: dict, report: ChangeReport):
+    report.blocks_scanned += 1
+    if not table_row_contains_dollar(row_block): return
+    operation = plan_table_row_update(row_block, read_format=True)
+    if operation is None: return
+    row_block["table_row"]["cells"] = operation["data"]["table_row"]["cells"]
+    report.table_rows_modified += 1
+    report.changes.append({"block_id": row_block.get("id"), "ops": ["update"]})
+
+
+def convert_sibling_blocks(blocks: list, report: ChangeReport):
+    """Aplica en memoria el plan de cada bloque de una lista de hermanos y devuelve la lista nueva."""
+    converted = []
+    for block in blocks:
+        converted.extend(convert_block(block, report))
+    return converted
+
+
+def convert_block(block: dict, report: ChangeReport):
+    """Devuelve los bloques que sustituyen a `block` (él mismo, actualizado, más los insertados)."""
+    report.blocks_scanned += 1
+    block_type = block.get("type")
+    if block_type == "table":
+        for row_block in block.get("children") or []:
+            if row_block.get("type") == "table_row": _apply_row_update(row_block, report)
+        return [block]
+
+    # En memoria siempre se puede insertar delante del bloque: no hace falta un hermano como
+    # ancla, así que el original se reutiliza también cuando empieza por una ecuación. El
+    # rich_text planificado conserva el plain_text y el href de cada objeto original (menciones
+    # y enlaces incluidos), como en una lectura de children.list.
+    operations = plan_block_mutations(block, has_previous_sibling=True, read_format=True) \
+        if block_type in TEXT_BEARING_BLOCK_TYPES else []
+    before, after, keep_block = [], [], True
+    for operation in operations:
+        if operation["op"] == "insert_before":
+            before.extend(operation["children"])
+        elif operation["op"] == "insert_after":
+            after.extend(operation["children"])
+        elif operation["op"] == "update":
+            block[block_type].update(operation["data"][block_type])
+        elif operation["op"] == "delete":
+            keep_block = False
+    before = [_export_block(child, block.get("id"), index) for index, child in enumerate(before)]
+    after = [_export_block(child, block.get("id"), len(before) + index) for index, child in enumerate(after)]
+    if operations:
+        report.blocks_modified += 1
+        report.blocks_inserted += len(before) + len(after)
+        report.blocks_deleted += 0 if keep_block else 1
+        report.changes.append({"block_id": block.get("id"), "ops": [operation["op"] for operation in operations],
+                               "inserted_ids": [inserted["id"] for inserted in before + after]})
+
+    if keep_block and block.get("children") and should_process_children(block):
+        block["children"] = convert_sibling_blocks(block["children"], report)
+    return before + ([block] if keep_block else []) + after
+
+
+def convert_file(input_path: str, output_path: str, chunk_size: int = READ_CHUNK_SIZE):
+    """Convierte un fichero exportado en streaming y escribe la salida y su informe de cambios."""
+    started = time.perf_counter()
+    report = ChangeReport(input_path, output_path)
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    temporary_path = output_path + ".tmp"
+    with open(input_path, encoding="utf-8") as input_file, open(temporary_path, "w", encoding="utf-8") as output_file:
+        reader = StreamingJsonReader(input_file, chunk_size)
+        is_bare_array = reader.peek() == "["
+        if not is_bare_array: output_file.write("{")
+        first_key = True
+        first_result = True
+        for event, key, value in iter_list_export(reader):
+            if event in ("key", "results_start") and key is not None:
+                output_file.write(("" if first_key else ", ") + json.dumps(key) + ": ")
+                first_key = False
+            if event == "key":
+                output_file.write(json.dumps(value, ensure_ascii=False))
+            elif event == "results_start":
+                output_file.write("[")
+            elif event == "result":
+                for converted_block in convert_block(value, report):
+                    output_file.write(("\n" if first_result else ",\n") + json.dumps(converted_block, ensure_ascii=False))
+                    first_result = False
+            elif event == "results_end":
+                output_file.write("\n]")
+        output_file.write("\n" if is_bare_array else "}\n")
+    # Se renombra al final: una conversión interrumpida nunca deja una salida a medias.
+    os.replace(temporary_path, output_path)
+    summary = report.to_dict(time.perf_counter() - started)
+    with open(output_path + REPORT_SUFFIX, "w", encoding="utf-8") as report_file:
+        json.dump(summary, report_file, indent=2, ensure_ascii=False)
+    summary["bytes"] = os.path.getsize(input_path)
+    del summary["changes"]
+    return summary
+
+
+def discover_input_files(inputs: list):
+    """Devuelve pares (ruta, ruta relativa) de los .json indicados o contenidos en directorios."""
+    input_files = []
+    for input_path in inputs:
+        if os.path.isdir(input_path):
+            for directory, _, file_names in os.walk(input_path):
+                for file_name in sorted(file_names):
+                    if file_name.endswith(".json") and not file_name.endswith(REPORT_SUFFIX):
+                        path = os.path.join(directory, file_name)
+                        input_files.append((path, os.path.relpath(path, input_path)))
+        else:
+            input_files.append((input_path, os.path.basename(input_path)))
+    # Los ficheros grandes primero: así el último en terminar no es uno enorme empezado tarde.
+    return sorted(input_files, key=lambda item: os.path.getsize(item[0]), reverse=True)
+
+
+def convert_files(inputs: list, output_dir: str, workers: int = None, chunk_size: int = READ_CHUNK_SIZE):
+    """Convierte todos los ficheros repartiéndolos entre `workers` procesos; devuelve sus resúmenes."""
+    input_files = discover_input_files(inputs)
+    summaries = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(convert_file, path, os.path.join(output_dir, relative_path), chunk_size): path
+                   for path, relative_path in input_files}
+        for future in as_completed(futures):
+            try:
+                summary = future.result()
+            except Exception as e:
+                summary = {"input": futures[future], "error": str(e)}
+                print(f"ERROR convirtiendo {futures[future]}: {e}", file=sys.stderr)
+            summaries.append(summary)
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="ficheros .json exportados o directorios que los contienen")
+    parser.add_argument("--output-dir", required=True, help="directorio donde escribir los ficheros convertidos")
+    parser.add_argument("--workers", type=int, default=None, help="procesos (por defecto, uno por núcleo)")
+    parser.add_argument("--chunk-size", type=int, default=READ_CHUNK_SIZE, help="bytes leídos por lectura")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    summaries = convert_files(args.inputs, args.output_dir, args.workers, args.chunk_size)
+    elapsed = time.perf_counter() - started
+    converted = [summary for summary in summaries if "error" not in summary]
+    total_bytes = sum(summary["bytes"] for summary in converted)
+    print(f"{len(converted)}/{len(summaries)} ficheros convertidos en {elapsed:.1f} s "
+          f"({total_bytes / elapsed / 1e6:.1f} MB/s): "
+          f"{sum(summary['blocks_modified'] for summary in converted)} bloques y "
+          f"{sum(summary['table_rows_modified'] for summary in converted)} filas modificados, "
+          f"{sum(summary['blocks_inserted'] for summary in converted)} bloques insertados.")
+    if len(converted) < len(summaries): sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
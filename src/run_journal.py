@@ -0,0 +1,115 @@
+import json
+import os
+
+
+class UnfinishedJournalError(Exception):
+    """El journal de una ejecución anterior tiene sustituciones a medias y no se usó --resume."""
+
+
+class RunJournal:
+    """Journal de escritura adelantada (JSON Lines) de una ejecución sobre una página.
+
+    Antes de tocar un bloque se registra su plan completo y, a medida que avanza, cada
+    operación terminada y los IDs de los bloques creados. Al terminar un subárbol sin errores
+    se marca como completo. Con esa información, `--resume` puede saltarse los subárboles
+    terminados y completar las sustituciones que quedaron a medias sin duplicar bloques.
+
+    Eventos:
+        {"event": "plan", "block_id", "parent_id", "anchor_id", "operations", "text_hash"}
+        {"event": "created", "block_id", "op_index", "ids"}
+        {"event": "op_done", "block_id", "op_index"}
+        {"event": "block_done", "block_id"}
+        {"event": "subtree_done", "block_id"}
+        {"event": "run_done"}
+    """
+
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        self._reset()
+        if os.path.exists(path):
+            self._load()
+            # Los planes en vuelo son el único registro de los bloques que crearon y del texto
+            # que su actualización pudo recortar del original: no se descartan sin avisar.
+            if not resume and self.in_flight_blocks:
+                raise UnfinishedJournalError(
+                    f"El journal {path} tiene {len(self.in_flight_blocks)} sustituciones a medias. Ejecuta "
+                    f"con --resume para completarlas o borra el fichero para descartarlas.")
+            if not resume: self._reset()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Una ejecución nueva empieza un journal vacío; una reanudación sigue escribiendo en el mismo.
+        self._file = open(path, "a" if resume else "w", encoding="utf-8")
+
+    def _reset(self):
+        self.in_flight_blocks = {}
+        self.done_blocks = set()
+        self.done_subtrees = set()
+        self.created_block_ids = set()
+        self.run_done = False
+
+    @classmethod
+    def for_page(cls, journal_dir: str, page_id: str, resume: bool = False):
+        return cls(os.path.join(journal_dir, f"{page_id}.jsonl"), resume=resume)
+
+    def _load(self):
+        with open(self.path, encoding="utf-8") as journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # última línea truncada por la interrupción
+                self._apply(record)
+
+    def _apply(self, record: dict):
+        event = record["event"]
+        if event == "plan":
+            self.in_flight_blocks[record["block_id"]] = {
+                "block_id": record["block_id"], "parent_id": record["parent_id"],
+                "anchor_id": record["anchor_id"], "operations": record["operations"],
+                "text_hash": record.get("text_hash"), "done_ops": set(), "created": {}}
+        elif event == "created":
+            entry = self.in_flight_blocks.get(record["block_id"])
+            if entry is not None:
+                entry["created"].setdefault(record["op_index"], []).extend(record["ids"])
+            self.created_block_ids.update(record["ids"])
+        elif event == "op_done":
+            entry = self.in_flight_blocks.get(record["block_id"])
+            if entry is not None: entry["done_ops"].add(record["op_index"])
+        elif event == "block_done":
+            self.in_flight_blocks.pop(record["block_id"], None)
+            self.done_blocks.add(record["block_id"])
+        elif event == "subtree_done":
+            self.done_subtrees.add(record["block_id"])
+        elif event == "run_done":
+            self.run_done = True
+
+    def _write(self, record: dict):
+        self._apply(record)
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        # Se vuelca en cada evento: un Ctrl-C o un error fatal no pierden lo ya escrito.
+        self._file.flush()
+
+    def record_plan(self, block_id: str, parent_id: str, anchor_id: str, operations: list, text_hash: str = None):
+        # text_hash es el del bloque original al planificar: permite detectar si se editó entretanto.
+        self._write({"event": "plan", "block_id": block_id, "parent_id": parent_id,
+                     "anchor_id": anchor_id, "operations": operations, "text_hash": text_hash})
+
+    def record_created(self, block_id: str, op_index: int, created_ids: list):
+        self._write({"event": "created", "block_id": block_id, "op_index": op_index, "ids": created_ids})
+
+    def record_op_done(self, block_id: str, op_index: int):
+        self._write({"event": "op_done", "block_id": block_id, "op_index": op_index})
+
+    def record_block_done(self, block_id: str):
+        self._write({"event": "block_done", "block_id": block_id})
+
+    def record_subtree_done(self, block_id: str):
+        self._write({"event": "subtree_done", "block_id": block_id})
+
+    def record_run_done(self):
+        self._write({"event": "run_done"})
+
+    def is_block_done(self, block_id: str) -> bool:
+        return block_id in self.done_blocks or block_id in self.created_block_ids
+
+    def close(self):
+        self._file.close()
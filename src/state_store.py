@@ -0,0 +1,75 @@
+import hashlib
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+# Notion redondea last_edited_time al minuto: un valor sólo es fiable si se verificó
+# al menos un minuto después, cuando cualquier edición posterior ya lo habría cambiado.
+LAST_EDITED_TIME_RESOLUTION = timedelta(minutes=1)
+
+
+def hash_text(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def parse_notion_time(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+class BlockStateStore:
+    """Estado persistente (SQLite) de las ejecuciones anteriores, para el modo incremental.
+
+    Guarda, por bloque, el last_edited_time y un hash de su texto tal y como quedaron tras
+    procesarlos; y, por página, el last_edited_time observado al terminar una ejecución
+    completa sin errores.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS blocks (
+                block_id TEXT PRIMARY KEY,
+                last_edited_time TEXT NOT NULL,
+                text_hash TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS pages (
+                page_id TEXT PRIMARY KEY,
+                last_edited_time TEXT NOT NULL,
+                verified_at TEXT NOT NULL
+            );
+        """)
+
+    def is_block_unchanged(self, block_id: str, last_edited_time: str, text_hash: str) -> bool:
+        row = self._connection.execute(
+            "SELECT last_edited_time, text_hash FROM blocks WHERE block_id = ?", (block_id,)).fetchone()
+        return row is not None and row == (last_edited_time, text_hash)
+
+    def record_block(self, block_id: str, last_edited_time: str, text_hash: str):
+        if not last_edited_time: return
+        self._connection.execute(
+            "INSERT OR REPLACE INTO blocks (block_id, last_edited_time, text_hash) VALUES (?, ?, ?)",
+            (block_id, last_edited_time, text_hash))
+
+    def forget_block(self, block_id: str):
+        self._connection.execute("DELETE FROM blocks WHERE block_id = ?", (block_id,))
+
+    def is_page_unchanged(self, page_id: str, last_edited_time: str) -> bool:
+        """True si la página no se ha editado desde la última ejecución completa verificada."""
+        row = self._connection.execute(
+            "SELECT last_edited_time, verified_at FROM pages WHERE page_id = ?", (page_id,)).fetchone()
+        if row is None or row[0] != last_edited_time:
+            return False
+        return datetime.fromisoformat(row[1]) >= parse_notion_time(last_edited_time) + LAST_EDITED_TIME_RESOLUTION
+
+    def record_page(self, page_id: str, last_edited_time: str, verified_at: datetime = None):
+        verified_at = verified_at or datetime.now(timezone.utc)
+        self._connection.execute(
+            "INSERT OR REPLACE INTO pages (page_id, last_edited_time, verified_at) VALUES (?, ?, ?)",
+            (page_id, last_edited_time, verified_at.isoformat()))
+
+    def commit(self):
+        self._connection.commit()
+
+    def close(self):
+        self._connection.commit()
+        self._connection.close()
@@ -0,0 +1,81 @@
+"""Pruebas del conversor offline: cortes de trozo del lector en streaming e idempotencia."""
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from offline_converter import READ_CHUNK_SIZE, convert_file  # noqa: E402
+
+
+def text(content, link=None, **annotations):
+    return {"type": "text", "text": {"content": content, "link": {"url": link} if link else None},
+            "annotations": dict({"bold": False, "italic": False, "code": False}, **annotations),
+            "plain_text": content, "href": link}
+
+
+def user_mention(user_id, name):
+    return {"type": "mention", "mention": {"type": "user", "user": {"object": "user", "id": user_id}},
+            "plain_text": f"@{name}", "href": None}
+
+
+def block(block_id, block_type, *rich_text, children=None, **type_data):
+    data = {"object": "block", "id": block_id, "type": block_type, "has_children": bool(children),
+            block_type: dict(type_data, rich_text=list(rich_text))}
+    if children: data["children"] = children
+    return data
+
+
+def table_row(block_id, *cells):
+    return {"object": "block", "id": block_id, "type": "table_row", "has_children": False,
+            "table_row": {"cells": [[text(cell)] for cell in cells]}}
+
+
+BLOCKS = [
+    block("b1", "paragraph", text("Hola "), user_mention("user-ana", "Ana"), text(", sea $x$ real.")),
+    block("b2", "paragraph", text("Ver ", bold=True), text("la guía $$E = mc^2$$", link="https://example.com"),
+          text(" y \"comillas\" \\$5 — ñandú 数学")),
+    block("b3", "to_do", text("$$\\int_0^1 f$$ tarea"), checked=True),
+    {"object": "block", "id": "t1", "type": "table", "has_children": True,
+     "table": {"table_width": 2, "has_column_header": False, "has_row_header": False},
+     "children": [table_row("r1", "$a^2$", "texto"), table_row("r2", "sin cambios", "$$b$$")]},
+    block("b4", "toggle", text("Desplegable $y$"), children=[
+        block("b5", "quote", text("Cita $$z$$ con "), user_mention("user-luis", "Luis"))]),
+    block("b6", "paragraph", text("Sin ecuaciones 12345")),
+]
+
+EXPORTS = {
+    "list": {"object": "list", "results": BLOCKS, "next_cursor": None, "has_more": False, "page_size": 100},
+    "bare_array": BLOCKS,
+}
+
+
+def convert(tmp_path, input_path, name, chunk_size):
+    output_path = str(tmp_path / name)
+    convert_file(str(input_path), output_path, chunk_size=chunk_size)
+    with open(output_path, encoding="utf-8") as output_file:
+        return output_file.read()
+
+
+@pytest.fixture(params=sorted(EXPORTS))
+def export_path(request, tmp_path):
+    input_path = tmp_path / "export.json"
+    input_path.write_text(json.dumps(EXPORTS[request.param], ensure_ascii=False, indent=1), encoding="utf-8")
+    return input_path
+
+
+def test_small_chunks_give_the_same_output(tmp_path, export_path):
+    expected = convert(tmp_path, export_path, "reference.json", READ_CHUNK_SIZE)
+    assert json.loads(expected) != json.loads(export_path.read_text(encoding="utf-8"))
+    for chunk_size in range(1, 8):
+        assert convert(tmp_path, export_path, f"chunk_{chunk_size}.json", chunk_size) == expected
+
+
+def test_converting_twice_changes_nothing(tmp_path, export_path):
+    once = convert(tmp_path, export_path, "once.json", READ_CHUNK_SIZE)
+    for chunk_size in (1, 3, READ_CHUNK_SIZE):
+        assert convert(tmp_path, tmp_path / "once.json", f"twice_{chunk_size}.json", chunk_size) == once
+    report = json.loads((tmp_path / f"twice_{READ_CHUNK_SIZE}.json.report.json").read_text(encoding="utf-8"))
+    assert report["changes"] == []
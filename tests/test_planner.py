@@ -0,0 +1,120 @@
+"""Pruebas del planificador de mutaciones (plan_block_mutations) sobre bloques en formato de lectura."""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from main import plan_block_mutations  # noqa: E402
+
+BLOCK_ID = "block-1"
+
+
+def text(content, link=None, **annotations):
+    # Objeto rich_text tal como lo devuelve children.list.
+    item = {"type": "text", "text": {"content": content, "link": {"url": link} if link else None},
+            "plain_text": content, "href": link}
+    if annotations: item["annotations"] = annotations
+    return item
+
+
+def equation(expression):
+    return {"type": "equation", "equation": {"expression": expression}, "plain_text": expression, "href": None}
+
+
+def block(*rich_text, block_type="paragraph", has_children=False, **type_data):
+    return {"id": BLOCK_ID, "type": block_type, "has_children": has_children,
+            block_type: dict(type_data, rich_text=list(rich_text))}
+
+
+def equation_block(expression):
+    return {"object": "block", "type": "equation", "equation": {"expression": expression}}
+
+
+def paragraph_block(*rich_text):
+    return {"object": "block", "type": "paragraph", "paragraph": {"rich_text": list(rich_text)}}
+
+
+def written(content, link=None, **annotations):
+    # Objeto rich_text en formato de escritura (sin plain_text ni href).
+    item = {"type": "text", "text": {"content": content}}
+    if link: item["text"]["link"] = {"url": link}
+    if annotations: item["annotations"] = annotations
+    return item
+
+
+def test_leading_equation_goes_before_the_original_when_there_is_an_anchor():
+    operations = plan_block_mutations(block(text("$$A$$ después")), has_previous_sibling=True)
+    assert operations == [
+        {"op": "insert_before", "children": [equation_block("A")]},
+        {"op": "update", "block_id": BLOCK_ID, "data": {"paragraph": {"rich_text": [written("después")]}},
+         "expected_plain_text": "después"},
+    ]
+
+
+def test_leading_equation_without_anchor_replaces_the_original():
+    operations = plan_block_mutations(block(text("$$A$$ después")), has_previous_sibling=False)
+    assert operations == [
+        {"op": "insert_after", "children": [equation_block("A"), paragraph_block(written("después"))]},
+        {"op": "delete", "block_id": BLOCK_ID},
+    ]
+
+
+def test_block_with_children_and_only_equations_is_rendered_inline():
+    # No puede borrarse (perdería sus hijos) ni reutilizarse como texto: las ecuaciones en
+    # bloque pasan a ser ecuaciones inline del propio bloque.
+    operations = plan_block_mutations(block(text("$$A$$ $$B$$"), has_children=True), has_previous_sibling=True)
+    assert operations == [
+        {"op": "update", "block_id": BLOCK_ID,
+         "data": {"paragraph": {"rich_text": [
+             {"type": "equation", "equation": {"expression": "A"}}, written(" "),
+             {"type": "equation", "equation": {"expression": "B"}}]}},
+         "expected_plain_text": "A B"},
+    ]
+
+
+def test_block_with_children_and_only_equations_without_anchor_is_rendered_inline():
+    operations = plan_block_mutations(block(text("$$A$$"), has_children=True), has_previous_sibling=False)
+    assert [operation["op"] for operation in operations] == ["update"]
+    assert operations[0]["data"]["paragraph"]["rich_text"] == [{"type": "equation", "equation": {"expression": "A"}}]
+
+
+def test_to_do_keeps_checked():
+    operations = plan_block_mutations(block(text("Hecho $x$"), block_type="to_do", checked=True),
+                                      has_previous_sibling=False)
+    assert operations[0]["data"] == {"to_do": {"rich_text": [
+        written("Hecho "), {"type": "equation", "equation": {"expression": "x"}}], "checked": True}}
+
+
+def test_to_do_keeps_checked_when_split_around_a_display_equation():
+    operations = plan_block_mutations(block(text("Hecho $$x$$ fin"), block_type="to_do", checked=False),
+                                      has_previous_sibling=False)
+    assert operations[-1]["data"] == {"to_do": {"rich_text": [written("Hecho")], "checked": False}}
+
+
+def test_annotations_and_links_are_sliced_across_the_equation_boundary():
+    rich_text = [text("Negrita $$A", bold=True), text("$$ enlace", link="https://example.com", italic=True)]
+    operations = plan_block_mutations(block(*rich_text), has_previous_sibling=False)
+    assert operations == [
+        {"op": "insert_after", "children": [
+            equation_block("A"), paragraph_block(written("enlace", link="https://example.com", italic=True))]},
+        {"op": "update", "block_id": BLOCK_ID, "data": {"paragraph": {"rich_text": [written("Negrita", bold=True)]}},
+         "expected_plain_text": "Negrita"},
+    ]
+
+
+def test_inline_equation_spanning_two_rich_text_items_keeps_the_surrounding_annotations():
+    rich_text = [text("a $x", bold=True), text("$ b", link="https://example.com")]
+    operations = plan_block_mutations(block(*rich_text), has_previous_sibling=False)
+    assert operations[0]["data"]["paragraph"]["rich_text"] == [
+        written("a ", bold=True), {"type": "equation", "equation": {"expression": "x"}},
+        written(" b", link="https://example.com")]
+
+
+def test_already_converted_block_needs_no_changes():
+    converted = block(text("Sea "), equation("x"), text(" real"))
+    assert plan_block_mutations(converted, has_previous_sibling=True) == []
+
+
+def test_block_with_only_escaped_or_unclosed_dollars_needs_no_changes():
+    assert plan_block_mutations(block(text(r"Cuesta \$5 y $$ sin cerrar")), has_previous_sibling=True) == []
+    assert plan_block_mutations(block(text("Sin dólares")), has_previous_sibling=True) == []
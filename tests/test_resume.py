@@ -0,0 +1,183 @@
+"""Pruebas de la reanudación con journal (--resume) contra el servidor Notion local.
+
+Cada prueba provoca un fallo en un endpoint concreto durante la primera ejecución y comprueba
+que, tras reanudar, la página queda igual que tras una ejecución sin fallos: sin texto perdido
+y sin bloques duplicados.
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from fake_notion_server import FakeNotionWorkspace, start_fake_notion_server  # noqa: E402
+from main import get_plain_text_from_rich_text, process_page  # noqa: E402
+from notion_scheduler import NotionRequestScheduler  # noqa: E402
+from run_journal import UnfinishedJournalError  # noqa: E402
+
+PAGE_ID = "00000000-0000-0000-0000-000000000001"
+UPDATE_ENDPOINT = "PATCH /v1/blocks/{id}"
+APPEND_ENDPOINT = "PATCH /v1/blocks/{id}/children"
+DELETE_ENDPOINT = "DELETE /v1/blocks/{id}"
+
+
+def paragraph(*rich_text):
+    return {"type": "paragraph", "paragraph": {"rich_text": list(rich_text)}}
+
+
+def text(content):
+    return {"type": "text", "text": {"content": content}}
+
+
+def user_mention(user_id, name):
+    # Tal como lo devuelve Notion al leer: el plain_text sólo aparece en las lecturas.
+    return {"type": "mention", "mention": {"type": "user", "user": {"object": "user", "id": user_id}},
+            "plain_text": f"@{name}"}
+
+
+@pytest.fixture
+def workspace():
+    workspace = FakeNotionWorkspace()
+    server, base_url = start_fake_notion_server(workspace)
+    workspace.base_url = base_url
+    yield workspace
+    server.shutdown()
+    server.server_close()
+
+
+def run(workspace, journal_dir, resume=False, max_retries=0):
+    # Por defecto sin reintentos: cada fallo inyectado llega tal cual al código de escritura.
+    scheduler = NotionRequestScheduler(requests_per_second=1000, burst_size=1000, max_retries=max_retries,
+                                       base_backoff=0.001)
+    return asyncio.run(process_page(PAGE_ID, "secret", scheduler=scheduler, notion_base_url=workspace.base_url,
+                                    journal_dir=str(journal_dir), resume=resume))
+
+
+def page_content(workspace):
+    content = []
+    for block_id in workspace.children[PAGE_ID]:
+        block = workspace.blocks[block_id]
+        if block["type"] == "equation":
+            content.append(("equation", block["equation"]["expression"]))
+        else:
+            content.append((block["type"], get_plain_text_from_rich_text(block[block["type"]]["rich_text"])))
+    return content
+
+
+def block_ids(workspace):
+    return list(workspace.children[PAGE_ID])
+
+
+def test_failed_append_leaves_original_text_intact(workspace, tmp_path):
+    workspace.add_page(PAGE_ID, [paragraph(text("Before $$A$$ after"))])
+    workspace.inject_failure(APPEND_ENDPOINT)
+
+    assert run(workspace, tmp_path).error_count == 1
+    assert page_content(workspace) == [("paragraph", "Before $$A$$ after")]
+
+    assert run(workspace, tmp_path, resume=True).error_count == 0
+    assert page_content(workspace) == [("paragraph", "Before"), ("equation", "A"), ("paragraph", "after")]
+
+
+def test_resume_adopts_blocks_of_a_lost_append_response(workspace, tmp_path):
+    workspace.add_page(PAGE_ID, [paragraph(text("Before $$A$$ after "), user_mention("user-ana", "Ana"))])
+    workspace.inject_failure(APPEND_ENDPOINT, applied=True)
+
+    assert run(workspace, tmp_path).error_count == 1
+    assert run(workspace, tmp_path, resume=True).error_count == 0
+    assert page_content(workspace) == [("paragraph", "Before"), ("equation", "A"), ("paragraph", "after @Ana")]
+
+
+def test_resume_completes_when_update_response_was_lost_with_mention(workspace, tmp_path):
+    workspace.add_page(PAGE_ID, [paragraph(text("See "), user_mention("user-ana", "Ana"), text(" and $$x$$ tail"))])
+    original_block_id = block_ids(workspace)[0]
+    workspace.inject_failure(UPDATE_ENDPOINT, applied=True, block_id=original_block_id)
+
+    assert run(workspace, tmp_path).error_count == 1
+    # La actualización se aplicó: el original ya no tiene la ecuación, que sólo está en los
+    # bloques insertados. Deshacer la sustitución perdería "x" y "tail".
+    assert page_content(workspace)[0] == ("paragraph", "See @Ana and")
+
+    assert run(workspace, tmp_path, resume=True).error_count == 0
+    assert page_content(workspace) == [("paragraph", "See @Ana and"), ("equation", "x"), ("paragraph", "tail")]
+    assert block_ids(workspace)[0] == original_block_id
+
+
+def test_failed_delete_keeps_order_and_resume_finishes_it(workspace, tmp_path):
+    workspace.add_page(PAGE_ID, [paragraph(text("$$A$$")), paragraph(text("$$B$$ after B"))])
+    workspace.inject_failure(DELETE_ENDPOINT, block_id=block_ids(workspace)[0])
+
+    assert run(workspace, tmp_path).error_count == 1
+    assert page_content(workspace) == [("paragraph", "$$A$$"), ("equation", "A"), ("equation", "B"),
+                                       ("paragraph", "after B")]
+
+    assert run(workspace, tmp_path, resume=True).error_count == 0
+    assert page_content(workspace) == [("equation", "A"), ("equation", "B"), ("paragraph", "after B")]
+
+
+def test_resume_finishes_when_delete_response_was_lost(workspace, tmp_path):
+    workspace.add_page(PAGE_ID, [paragraph(text("$$A$$ after"))])
+    workspace.inject_failure(DELETE_ENDPOINT, applied=True)
+
+    assert run(workspace, tmp_path).error_count == 1
+    assert page_content(workspace) == [("equation", "A"), ("paragraph", "after")]
+
+    # El original ya no existe porque lo borró el propio plan: no hay que deshacer nada.
+    assert run(workspace, tmp_path, resume=True).error_count == 0
+    assert page_content(workspace) == [("equation", "A"), ("paragraph", "after")]
+
+
+def test_retried_delete_after_a_lost_response_counts_as_done(workspace, tmp_path):
+    workspace.add_page(PAGE_ID, [paragraph(text("intro")), paragraph(text("$$A$$")), paragraph(text("tail"))])
+    workspace.inject_failure(DELETE_ENDPOINT, applied=True, block_id=block_ids(workspace)[1])
+
+    # El reintento del borrado recibe un 404 porque el primer intento sí se aplicó.
+    assert run(workspace, tmp_path, max_retries=2).error_count == 0
+    assert page_content(workspace) == [("paragraph", "intro"), ("equation", "A"), ("paragraph", "tail")]
+
+
+def test_failed_table_row_update_is_not_counted_as_modified(workspace, tmp_path):
+    row = {"type": "table_row", "table_row": {"cells": [[text("$a$")], [text("b")]]}}
+    workspace.add_page(PAGE_ID, [{"type": "table", "table": {"table_width": 2}, "children": [row]}])
+    row_id = workspace.children[block_ids(workspace)[0]][0]
+    workspace.inject_failure(UPDATE_ENDPOINT, block_id=row_id)
+
+    context = run(workspace, tmp_path)
+    assert (context.error_count, context.blocks_modified) == (1, 0)
+
+    context = run(workspace, tmp_path)
+    assert (context.error_count, context.blocks_modified) == (0, 1)
+    assert workspace.blocks[row_id]["table_row"]["cells"][0][0]["type"] == "equation"
+
+
+def test_resume_rolls_back_when_original_was_edited(workspace, tmp_path):
+    workspace.add_page(PAGE_ID, [paragraph(text("Before $$A$$ after"))])
+    original_block_id = block_ids(workspace)[0]
+    workspace.inject_failure(APPEND_ENDPOINT, applied=True)
+
+    assert run(workspace, tmp_path).error_count == 1
+    workspace.update_block(original_block_id, {"paragraph": {"rich_text": [text("Edited by hand")]}})
+
+    assert run(workspace, tmp_path, resume=True).error_count == 0
+    assert page_content(workspace) == [("paragraph", "Edited by hand")]
+
+
+def test_fresh_run_refuses_a_journal_with_unfinished_blocks(workspace, tmp_path):
+    workspace.add_page(PAGE_ID, [paragraph(text("Before $$A$$ after"))])
+    workspace.inject_failure(APPEND_ENDPOINT)
+    assert run(workspace, tmp_path).error_count == 1
+    journal_path = tmp_path / f"{PAGE_ID}.jsonl"
+    journal_before = journal_path.read_text(encoding="utf-8")
+
+    with pytest.raises(UnfinishedJournalError):
+        run(workspace, tmp_path)
+    assert journal_path.read_text(encoding="utf-8") == journal_before
+
+
+def test_fresh_run_after_a_clean_run_starts_a_new_journal(workspace, tmp_path):
+    workspace.add_page(PAGE_ID, [paragraph(text("Sea $x$ real"))])
+    assert run(workspace, tmp_path).error_count == 0
+    assert run(workspace, tmp_path).error_count == 0
+    assert page_content(workspace) == [("paragraph", "Sea x real")]
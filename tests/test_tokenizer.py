@@ -0,0 +1,84 @@
+"""Pruebas del tokenizador de KaTeX (segment_katex_text): entrada -> segmentos esperados."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from main import segment_katex_text  # noqa: E402
+
+CASES = [
+    # Sin ecuaciones
+    ("", []),
+    ("Sin dólares", [("text", "Sin dólares")]),
+    ("Cuesta $5", [("text", "Cuesta $5")]),
+    # Ecuaciones inline y en bloque
+    ("$x$", [("katex", "x")]),
+    ("Sea $x$ real", [("text", "Sea "), ("katex", "x"), ("text", " real")]),
+    ("$$A$$", [("block_katex", "A")]),
+    ("Antes $$ A $$ después", [("text", "Antes "), ("block_katex", "A"), ("text", " después")]),
+    ("$x$ y $$y$$", [("katex", "x"), ("text", " y "), ("block_katex", "y")]),
+    ("$$a$$$b$", [("block_katex", "a"), ("katex", "b")]),
+    # Un $ suelto dentro de $$...$$ no cierra la ecuación en bloque
+    ("$$a$b$$", [("block_katex", "a$b")]),
+    ("$$f(x) = $5$ + 1$$ fin", [("block_katex", "f(x) = $5$ + 1"), ("text", " fin")]),
+    # \$ escapado se queda como texto literal
+    (r"\$5 y \$6", [("text", r"\$5 y \$6")]),
+    (r"$\$5$", [("katex", r"\$5")]),
+    (r"$$a\$$b$$", [("block_katex", r"a\$$b")]),
+    (r"\$x\$ y $y$", [("text", r"\$x\$ y "), ("katex", "y")]),
+    # Delimitadores sin cerrar se quedan como texto
+    ("a $$x", [("text", "a $$x")]),
+    ("$$x$", [("text", "$$x$")]),
+    (r"$$ x \$$", [("text", r"$$ x \$$")]),
+    ("$$x$$ y $$z", [("block_katex", "x"), ("text", " y $$z")]),
+    # Las ecuaciones vacías se omiten
+    ("$$ $$", [("text", "$$ $$")]),
+    ("$ $", [("text", "$ $")]),
+    ("$$$$", [("text", "$$$$")]),
+    ("a $ $ b $c$", [("text", "a $ $ b "), ("katex", "c")]),
+]
+
+# Entradas adversarias para la búsqueda anticipada de `$$`: muchos delimitadores sin cerrar o
+# escapados no deben producir ecuaciones ni tardar más que un recorrido lineal.
+ADVERSARIAL_CASES = [
+    "$$" + "x" * 50000,
+    "$$ " * 20000,
+    "$$" + "\\$ x" * 20000,
+    "$$" + "\\$" * 20000 + "$",
+    "$$ x " + "\\$" * 20000 + "\\$$",
+    "$$ " * 20000 + "\\$",
+]
+
+
+@pytest.mark.parametrize("text, expected", CASES)
+def test_segments(text, expected):
+    segments = segment_katex_text(text)
+    assert [(seg_type, content) for seg_type, content, _, _ in segments] == expected
+    assert_offsets_cover(text, segments)
+
+
+@pytest.mark.parametrize("text", ADVERSARIAL_CASES, ids=lambda text: text[:8])
+def test_adversarial_input_stays_text(text):
+    segments = segment_katex_text(text)
+    assert [seg_type for seg_type, _, _, _ in segments] == ["text"]
+    assert_offsets_cover(text, segments)
+
+
+def test_closed_equation_after_many_unclosed_delimiters():
+    text = "$x " * 10000 + "$$y$$"
+    segments = segment_katex_text(text)
+    assert segments[-1][:2] == ("block_katex", "y")
+    assert_offsets_cover(text, segments)
+
+
+def assert_offsets_cover(text, segments):
+    # Los segmentos son consecutivos, cubren todo el texto y los de texto son rebanadas literales.
+    position = 0
+    for seg_type, content, start, end in segments:
+        assert start == position and end > start
+        if seg_type == "text":
+            assert content == text[start:end]
+        position = end
+    assert position == len(text)